@@ -0,0 +1,216 @@
+"""
+Minimal stand-in for the Ollama HTTP API, for benchmarks without a GPU or
+real models.
+
+Serves /api/chat (streaming and non-streaming), /api/embed, /api/tags and
+/api/ps with configurable latency and token rates.
+
+Usage:
+    python -m benchmarks.fake_ollama --port 11500 --tokens-per-s 40
+"""
+import argparse
+import hashlib
+import json
+import math
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_MODELS = ["fake-chat:latest", "fake-vision:latest",
+               "fake-embed-text:latest"]
+
+
+class FakeOllamaServer:
+    """
+    Threaded fake Ollama server.
+
+    Args:
+        port (int): The port to listen on, 0 picks a free one.
+        first_token_latency_s (float): Delay before the first chat token,
+            standing in for prompt evaluation.
+        tokens_per_s (float): Generation speed of chat answers.
+        answer_tokens (int): Number of tokens in every chat answer.
+        embed_latency_s (float): Fixed latency per /api/embed request.
+        embed_per_input_s (float): Additional latency per embedded text.
+        embedding_dim (int): Dimension of the returned vectors.
+    """
+
+    def __init__(self, port=0, first_token_latency_s=0.05, tokens_per_s=50,
+                 answer_tokens=64, embed_latency_s=0.01,
+                 embed_per_input_s=0.001, embedding_dim=256):
+        self.first_token_latency_s = first_token_latency_s
+        self.tokens_per_s = tokens_per_s
+        self.answer_tokens = answer_tokens
+        self.embed_latency_s = embed_latency_s
+        self.embed_per_input_s = embed_per_input_s
+        self.embedding_dim = embedding_dim
+        self.request_counts = {}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port),
+                                         make_handler(self))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, path):
+        with self._lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def embed(self, text):
+        # Deterministic unit vectors so that identical texts match
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        vector = [digest[i % len(digest)] / 255 - 0.5 + math.sin(i)
+                  for i in range(self.embedding_dim)]
+        norm = math.sqrt(sum(value * value for value in vector)) or 1
+        return [value / norm for value in vector]
+
+
+def make_handler(server):
+    class FakeOllamaHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, payload, status=200):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_json(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            server.count(self.path)
+            if self.path == "/api/tags":
+                self.send_json({"models": [{"name": name}
+                                           for name in FAKE_MODELS]})
+            elif self.path == "/api/ps":
+                self.send_json({"models": [{"name": FAKE_MODELS[0],
+                                            "size": 4 * 1024 ** 3}]})
+            else:
+                self.send_json({"error": "not found"}, status=404)
+
+        def do_POST(self):
+            server.count(self.path)
+            request = self.read_json()
+            if self.path == "/api/chat":
+                self.chat(request)
+            elif self.path == "/api/embed":
+                self.embed(request)
+            elif self.path == "/api/pull":
+                self.send_json({"status": "success"})
+            else:
+                self.send_json({"error": "not found"}, status=404)
+
+        def chat(self, request):
+            model = request.get("model", FAKE_MODELS[0])
+            prompt_tokens = sum(len(str(message.get("content", ""))) // 4
+                                for message in request.get("messages", []))
+            if not request.get("messages"):
+                # Load request from the residency manager
+                self.send_json({"model": model, "done": True,
+                                "message": {"role": "assistant",
+                                            "content": ""}})
+                return
+
+            start_time = time.perf_counter()
+            time.sleep(server.first_token_latency_s)
+            prompt_eval_ns = int((time.perf_counter() - start_time) * 1e9)
+            token_delay_s = 1 / server.tokens_per_s
+            tokens = [f"tok{i} " for i in range(server.answer_tokens)]
+
+            def final_chunk(content):
+                total_ns = int((time.perf_counter() - start_time) * 1e9)
+                return {"model": model, "done": True,
+                        "message": {"role": "assistant", "content": content},
+                        "total_duration": total_ns, "load_duration": 0,
+                        "prompt_eval_count": prompt_tokens,
+                        "prompt_eval_duration": prompt_eval_ns,
+                        "eval_count": len(tokens),
+                        "eval_duration": total_ns - prompt_eval_ns}
+
+            if not request.get("stream", True):
+                time.sleep(token_delay_s * len(tokens))
+                self.send_json(final_chunk("".join(tokens)))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(token_delay_s)
+                self.write_chunk({"model": model, "done": False,
+                                  "message": {"role": "assistant",
+                                              "content": token}})
+            self.write_chunk(final_chunk(""))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def write_chunk(self, payload):
+            line = json.dumps(payload).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            self.wfile.flush()
+
+        def embed(self, request):
+            inputs = request.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            time.sleep(server.embed_latency_s +
+                       server.embed_per_input_s * len(inputs))
+            self.send_json({
+                "model": request.get("model"),
+                "embeddings": [server.embed(text) for text in inputs],
+                "load_duration": 0,
+                "prompt_eval_count": sum(len(text) // 4 for text in inputs)})
+
+    return FakeOllamaHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server.")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--first-token-latency-s", type=float, default=0.05)
+    parser.add_argument("--tokens-per-s", type=float, default=50)
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--embed-latency-s", type=float, default=0.01)
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(
+        port=args.port, first_token_latency_s=args.first_token_latency_s,
+        tokens_per_s=args.tokens_per_s, answer_tokens=args.answer_tokens,
+        embed_latency_s=args.embed_latency_s)
+    print(f"Fake Ollama listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Offline performance benchmarks against a fake Ollama server.
+
+Measures end-to-end chat latency, PDF ingestion throughput, chat history
+load time against database size and transcription real-time factor, and
+writes the results as JSON so runs can be compared.
+
+Usage:
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --only chat ingestion
+"""
+import argparse
+import json
+import logging
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.fake_ollama import FAKE_MODELS, FakeOllamaServer
+from benchmarks.synthetic import NamedBytesIO, make_pdf, make_wav
+
+BENCHMARKS = ("chat", "ingestion", "history", "transcription")
+
+
+def override_config(updates):
+    """
+    Apply ``updates`` to the config of every loaded ``src`` module, so the
+    app talks to the fake server and writes into a scratch directory.
+    """
+    for name, module in list(sys.modules.items()):
+        module_config = getattr(module, "config", None)
+        if name.startswith("src.") and isinstance(module_config, dict):
+            deep_update(module_config, updates)
+
+
+def deep_update(target, updates):
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            deep_update(target[key], value)
+        else:
+            target[key] = value
+
+
+def summarize(durations):
+    durations = sorted(durations)
+    return {
+        "count": len(durations),
+        "mean_s": statistics.fmean(durations),
+        "p50_s": durations[len(durations) // 2],
+        "p95_s": durations[min(len(durations) - 1,
+                               int(len(durations) * 0.95))],
+        "max_s": durations[-1],
+    }
+
+
+def bench_chat(args):
+    from src.llm.chat_api_handler import ChatAPIHandler
+
+    history = [{"role": "user" if i % 2 == 0 else "assistant",
+                "content": f"earlier message {i} " * 20}
+               for i in range(args.history_messages)]
+
+    blocking = []
+    for _ in range(args.chat_requests):
+        start_time = time.perf_counter()
+        ChatAPIHandler.chat(user_input="How do I reset the unit?",
+                            chat_history=list(history),
+                            model=FAKE_MODELS[0])
+        blocking.append(time.perf_counter() - start_time)
+
+    first_token = []
+    streamed = []
+    for _ in range(args.chat_requests):
+        start_time = time.perf_counter()
+        first = None
+        for _ in ChatAPIHandler.chat(user_input="How do I reset the unit?",
+                                     chat_history=list(history),
+                                     model=FAKE_MODELS[0], stream=True):
+            if first is None:
+                first = time.perf_counter() - start_time
+        first_token.append(first)
+        streamed.append(time.perf_counter() - start_time)
+
+    return {"blocking": summarize(blocking),
+            "streaming_total": summarize(streamed),
+            "streaming_first_token": summarize(first_token)}
+
+
+def bench_ingestion(args):
+    from src.database.vectordb_handler import (get_collection,
+                                               invalidate_vectordb)
+    from src.handler.pdf_handler import add_documents_to_db
+
+    invalidate_vectordb()
+    pdfs = [NamedBytesIO(make_pdf(args.pdf_pages, seed=i), f"manual_{i}.pdf")
+            for i in range(args.pdf_files)]
+    chunks_before = get_collection().count()
+
+    start_time = time.perf_counter()
+    add_documents_to_db(pdfs)
+    duration_s = time.perf_counter() - start_time
+    chunks = get_collection().count() - chunks_before
+
+    start_time = time.perf_counter()
+    add_documents_to_db(pdfs)
+    reupload_s = time.perf_counter() - start_time
+
+    pages = args.pdf_pages * args.pdf_files
+    return {"files": args.pdf_files, "pages": pages, "chunks": chunks,
+            "duration_s": duration_s,
+            "pages_per_s": pages / duration_s,
+            "chunks_per_s": chunks / duration_s,
+            "reupload_duration_s": reupload_s}
+
+
+def bench_history(args, db_path):
+    from src.database import db_operations
+
+    db_operations.init_db()
+    conn = sqlite3.connect(db_path)
+    results = []
+    inserted = 0
+    for size in args.history_sizes:
+        rows = [(f"session-{i % args.history_sessions}", "user", "text",
+                 f"message {i} " * 10)
+                for i in range(inserted, size)]
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages (chat_history_id, sender_type, "
+                "message_type, text_content) VALUES (?, ?, ?, ?)", rows)
+        inserted = size
+
+        timings = {"messages": size}
+        for name, call in (
+                ("get_all_chat_history_ids",
+                 db_operations.get_all_chat_history_ids),
+                ("load_messages_page", lambda: db_operations
+                 .load_messages_page("session-0", 50)),
+                ("load_last_k_text_messages", lambda: db_operations
+                 .load_last_k_text_messages_ollama("session-0", 20)),
+                ("load_messages", lambda: db_operations
+                 .load_messages("session-0"))):
+            durations = []
+            for _ in range(args.history_repeats):
+                start_time = time.perf_counter()
+                call()
+                durations.append(time.perf_counter() - start_time)
+            timings[name] = summarize(durations)
+        results.append(timings)
+    conn.close()
+    return results
+
+
+def bench_transcription(args):
+    try:
+        import transformers  # noqa: F401
+    except ImportError:
+        return {"skipped": "transformers is not installed"}
+    from src.handler.audio_handler import transcribe_audio
+
+    audio_bytes = make_wav(args.audio_seconds)
+    transcribe_audio(audio_bytes)  # Loads the model
+    start_time = time.perf_counter()
+    transcribe_audio(audio_bytes)
+    duration_s = time.perf_counter() - start_time
+    return {"audio_s": args.audio_seconds, "duration_s": duration_s,
+            "real_time_factor": duration_s / args.audio_seconds}
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the offline benchmarks against a fake Ollama.")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS,
+                        default=list(BENCHMARKS))
+    parser.add_argument("--tokens-per-s", type=float, default=200)
+    parser.add_argument("--first-token-latency-s", type=float, default=0.05)
+    parser.add_argument("--embed-latency-s", type=float, default=0.01)
+    parser.add_argument("--chat-requests", type=int, default=10)
+    parser.add_argument("--history-messages", type=int, default=20)
+    parser.add_argument("--pdf-files", type=int, default=2)
+    parser.add_argument("--pdf-pages", type=int, default=50)
+    parser.add_argument("--history-sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000])
+    parser.add_argument("--history-sessions", type=int, default=100)
+    parser.add_argument("--history-repeats", type=int, default=20)
+    parser.add_argument("--audio-seconds", type=float, default=30)
+    args = parser.parse_args()
+
+    import src.app  # noqa: F401  Loads every module that reads the config
+
+    # Streamlit warns on every session_state access outside "streamlit run"
+    for logger_name in list(logging.root.manager.loggerDict):
+        if logger_name.startswith("streamlit"):
+            logging.getLogger(logger_name).setLevel(logging.ERROR)
+
+    scratch_dir = Path(tempfile.mkdtemp(prefix="chatbot_bench_"))
+    server = FakeOllamaServer(
+        first_token_latency_s=args.first_token_latency_s,
+        tokens_per_s=args.tokens_per_s,
+        embed_latency_s=args.embed_latency_s).start()
+    override_config({
+        "ollama": {"base_url": server.base_url,
+                   "embedding_model": FAKE_MODELS[2]},
+        "database": {"chat_history_path": str(scratch_dir / "chat.db"),
+                     "blob_store_path": str(scratch_dir / "blobs")},
+        "chromadb": {"chromadb_path": str(scratch_dir / "chroma")},
+        "embedding_cache": {"path": str(scratch_dir / "embeddings.db")},
+        "metrics": {"path": str(scratch_dir / "metrics.db")},
+        "response_cache": {"path": str(scratch_dir / "response_cache.db")},
+    })
+
+    results = {}
+    try:
+        for name in args.only:
+            print(f"Running {name} benchmark...")
+            if name == "chat":
+                results[name] = bench_chat(args)
+            elif name == "ingestion":
+                results[name] = bench_ingestion(args)
+            elif name == "history":
+                results[name] = bench_history(
+                    args, scratch_dir / "chat.db")
+            elif name == "transcription":
+                results[name] = bench_transcription(args)
+    finally:
+        server.stop()
+        from src.database.db_operations import wait_for_pending_writes
+
+        wait_for_pending_writes()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": get_git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "arguments": vars(args),
+        "fake_ollama_requests": server.request_counts,
+        "results": results,
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
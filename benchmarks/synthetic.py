@@ -0,0 +1,105 @@
+"""
+Synthetic inputs for the benchmarks: text PDFs and speech-like WAV clips.
+"""
+import io
+import math
+import random
+import struct
+import wave
+
+WORDS = ("the engine pressure valve manual section maintenance check torque "
+         "filter replace install safety warning operator model serial unit "
+         "temperature sensor cable connector panel reset procedure step "
+         "inspect clean lubricate bearing housing assembly").split()
+
+
+def make_text(words, rng):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def make_pdf(pages=10, words_per_page=300, seed=0):
+    """
+    Build a text-only PDF with ``pages`` pages of random manual-like text.
+
+    Returns:
+        bytes: The PDF file.
+    """
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, filled in once the page ids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page_number in range(pages):
+        text = make_text(words_per_page, rng)
+        lines = [text[i:i + 90] for i in range(0, len(text), 90)]
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL\n"
+        stream += f"(Page {page_number + 1}) Tj T*\n"
+        stream += "".join(f"({line}) Tj T*\n" for line in lines)
+        stream += "ET"
+        stream = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream"
+                       % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R "
+                       b"/MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> "
+                       b"/Contents %d 0 R >>" % content_id)
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for object_id, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(b"%d 0 obj\n%s\nendobj\n" % (object_id, body))
+    xref_offset = output.tell()
+    output.write(b"xref\n0 %d\n" % (len(objects) + 1))
+    output.write(b"0000000000 65535 f \n")
+    for offset in offsets:
+        output.write(b"%010d 00000 n \n" % offset)
+    output.write(b"trailer\n<< /Size %d /Root 1 0 R >>\n"
+                 % (len(objects) + 1))
+    output.write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+    return output.getvalue()
+
+
+def make_wav(seconds=10.0, sample_rate=16000, seed=0):
+    """
+    Build a mono 16-bit WAV of tone bursts separated by short silences,
+    roughly shaped like speech for voice-activity detection.
+
+    Returns:
+        bytes: The WAV file.
+    """
+    rng = random.Random(seed)
+    samples = []
+    while len(samples) < seconds * sample_rate:
+        burst_s = rng.uniform(0.5, 3.0)
+        frequency = rng.uniform(120, 300)
+        samples.extend(
+            0.3 * math.sin(2 * math.pi * frequency * i / sample_rate)
+            for i in range(int(burst_s * sample_rate)))
+        samples.extend([0.0] * int(rng.uniform(0.2, 0.8) * sample_rate))
+    samples = samples[:int(seconds * sample_rate)]
+
+    output = io.BytesIO()
+    with wave.open(output, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(struct.pack(
+            f"<{len(samples)}h",
+            *(int(sample * 32767) for sample in samples)))
+    return output.getvalue()
+
+
+class NamedBytesIO(io.BytesIO):
+    """Mimics Streamlit's UploadedFile for the handlers."""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
@@ -14,6 +14,13 @@ setup(
         "torchvision",
         "torchaudio",
         "transformers",
-        "streamlit-mic-recorder"
+        "streamlit-mic-recorder",
+        "aiohttp",
+        "Pillow"
     ],
+    entry_points={
+        "console_scripts": [
+            "chatbot-batch=src.service.batch_runner:main",
+        ],
+    },
 )
\ No newline at end of file
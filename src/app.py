@@ -1,22 +1,25 @@
-import streamlit as st
+from src.utils import startup_profile
+
+startup_profile.start()  # Before the imports it times
+
+import streamlit as st  # noqa: E402
 
-from pathlib import Path
 from src.database.db_operations import (
     get_all_chat_history_ids, delete_chat_history,
-    save_text_message, load_last_k_text_messages_ollama, load_messages,
-    save_image_message,  save_audio_message, init_db)
-from src.handler.pdf_handler import add_documents_to_db
-from src.handler.audio_handler import transcribe_audio
+    save_text_message, load_messages_page, save_image_message,
+    save_audio_message, init_db)
+from src.handler.asr_registry import warmup_asr_model
+from src.handler.image_handler import get_history_image
 from src.llm.chat_api_handler import ChatAPIHandler
+from src.llm.conversation_summary import load_chat_memory, schedule_summary
+from src.llm.model_residency import get_residency_manager
 from src.templates.html_templates import css
 from src.utils import config_loader
 from src.utils.utils import (list_ollama_models, get_timestamp, command,
                              get_avatar)
 from streamlit_mic_recorder import mic_recorder
 
-PROJECT_ROOT = Path(__file__).parent.parent
-
-config = config_loader.load_config(f"{PROJECT_ROOT}/src/config/config.yaml")
+config = config_loader.get_config()
 
 
 def toggle_pdf_chat():
@@ -37,17 +40,102 @@ def get_session_key():
 
 def delete_chat_session_history():
     delete_chat_history(st.session_state.session_key)
+    st.session_state.history_pages.pop(st.session_state.session_key, None)
     st.session_state.session_index_tracker = "new_session"
 
 
+def load_history_window(session_key):
+    """
+    Load the messages to render for a session.
+
+    Only the newest ``history_page_size`` messages are read from the
+    database on a rerun. Earlier pages requested with "Load earlier
+    messages" are cached per session, so after that only the messages
+    newer than the cached pages are read.
+
+    Returns:
+        tuple: The session's page cache and the messages to render.
+    """
+    page_size = config["chat_config"]["history_page_size"]
+    history = st.session_state.history_pages.setdefault(
+        session_key, {"older": [], "has_more": False})
+
+    if history["older"]:
+        recent = load_messages_page(
+            session_key, after_message_id=history["older"][-1]["message_id"])
+    else:
+        recent = load_messages_page(session_key, page_size + 1)
+        history["has_more"] = len(recent) > page_size
+        recent = recent[-page_size:]
+    return history, history["older"] + recent
+
+
+def load_earlier_messages(session_key, oldest_message_id):
+    page_size = config["chat_config"]["history_page_size"]
+    history = st.session_state.history_pages[session_key]
+    page = load_messages_page(session_key, page_size + 1,
+                              before_message_id=oldest_message_id)
+    history["has_more"] = len(page) > page_size
+    history["older"] = page[-page_size:] + history["older"]
+
+
 def update_model_options():
     st.session_state.model_options = list_model_options()
 
 
+def preload_selected_model():
+    get_residency_manager().preload(st.session_state.model_to_use)
+
+
 def clear_cache():
     st.cache_resource.clear()
 
 
+def get_llm_answer(response_container, user_message=None, **chat_kwargs):
+    """
+    Get the assistant's answer, streaming it into ``response_container``
+    while it is generated when streaming is enabled in the config.
+
+    Returns:
+        str: The complete answer, ready to be saved.
+    """
+    chat_kwargs.update(model=st.session_state.model_to_use,
+                       endpoint=st.session_state.endpoint_to_use,
+                       pdf_chat=st.session_state.get("pdf_chat", False))
+    if not config["chat_config"].get("stream_responses", False):
+        return ChatAPIHandler.chat(**chat_kwargs)
+
+    with response_container.container():
+        if user_message:
+            with st.chat_message(name="user", avatar=get_avatar("user")):
+                st.write(user_message)
+        with st.chat_message(name="assistant",
+                             avatar=get_avatar("assistant")):
+            return st.write_stream(ChatAPIHandler.chat(stream=True,
+                                                       **chat_kwargs))
+
+
+def transcribe_with_progress(response_container, audio_bytes):
+    """
+    Transcribe an uploaded recording, showing the transcript in
+    ``response_container`` as its segments are transcribed.
+
+    Returns:
+        str: The complete transcript.
+    """
+    from src.handler.audio_handler import transcribe_long_audio
+
+    parts = []
+    with response_container.container():
+        with st.chat_message(name="user", avatar=get_avatar("user")):
+            transcript_placeholder = st.empty()
+            transcript_placeholder.write("Transcribing...")
+            for segment in transcribe_long_audio(audio_bytes):
+                parts.append(segment["text"].strip())
+                transcript_placeholder.write(" ".join(parts) + " ...")
+    return " ".join(parts)
+
+
 def list_model_options():
     """
     List all available model options from the configuration file.
@@ -79,6 +167,7 @@ def main():
         st.session_state.model_tracker = None
         st.session_state.audio_uploader_key = 0
         st.session_state.pdf_uploader_key = 1
+        st.session_state.history_pages = {}
 
     # Handle new session creation
     if (st.session_state.session_key == "new_session" and
@@ -89,7 +178,10 @@ def main():
         st.session_state.new_session_key = None
 
     st.sidebar.title("Chat Sessions")
-    chat_sessions = ["new_session"] + get_all_chat_history_ids()
+    current_session = st.session_state.session_index_tracker
+    chat_sessions = ["new_session"] + get_all_chat_history_ids(
+        wait_for=(None if current_session == "new_session"
+                  else current_session))
     try:
         index = chat_sessions.index(st.session_state.session_index_tracker)
     except ValueError:
@@ -107,7 +199,9 @@ def main():
                       on_change=update_model_options)
     model_col.selectbox(label="Select a Model",
                         options=st.session_state.model_options,
-                        key="model_to_use")
+                        key="model_to_use",
+                        on_change=preload_selected_model)
+    get_residency_manager().warm_up(st.session_state.model_to_use)
 
     pdf_toggle_col, voice_rec_col = st.sidebar.columns(2)
     pdf_toggle_col.toggle("PDF Chat", key="pdf_chat",
@@ -123,12 +217,15 @@ def main():
                            on_click=delete_chat_session_history)
 
     chat_container = st.container()
+    response_container = st.empty()
     user_input = st.chat_input("Type your message here", key="user_input")
 
     uploaded_pdf = st.sidebar.file_uploader(
         "Upload a pdf file", accept_multiple_files=True,
         key=st.session_state.pdf_uploader_key, type=["pdf"],
         on_change=toggle_pdf_chat)
+    replace_pdfs = st.sidebar.checkbox(
+        "Replace stored pdfs with the same name", key="replace_pdfs")
     uploaded_image = st.sidebar.file_uploader(
         "Upload an image file", type=["jpg", "jpeg", "png"],
         on_change=detoggle_pdf_chat)
@@ -137,20 +234,43 @@ def main():
         key=st.session_state.audio_uploader_key)
 
     if uploaded_pdf:
+        # Imported on first use, loading chroma and langchain takes seconds
+        from src.handler.pdf_handler import add_documents_to_db
+
         with st.spinner("Processing pdf..."):
-            add_documents_to_db(uploaded_pdf)
-            st.session_state.pdf_uploader_key += 2
+            progress_bar = st.sidebar.progress(0.0)
+
+            def show_progress(fraction, text):
+                if fraction is not None:
+                    progress_bar.progress(fraction, text=text)
+
+            try:
+                add_documents_to_db(uploaded_pdf,
+                                    progress_callback=show_progress,
+                                    replace=replace_pdfs)
+            except RuntimeError as e:
+                # The message says how many chunks were stored and that
+                # uploading the files again resumes the ingestion
+                st.error(f"Processing the pdf failed: {e}")
+            finally:
+                progress_bar.empty()
+                # A new key clears the uploader, so a failed upload is not
+                # retried on every rerun
+                st.session_state.pdf_uploader_key += 2
 
     if voice_recording:
+        from src.handler.audio_handler import transcribe_audio
+
         transcribed_audio = transcribe_audio(voice_recording["bytes"])
-        print(transcribed_audio)
-        llm_answer = ChatAPIHandler.chat(
+        llm_answer = get_llm_answer(
+            response_container,
             user_input=transcribed_audio,
-            chat_history=load_last_k_text_messages_ollama(
+            chat_history=load_chat_memory(
                 get_session_key(),
                 config["chat_config"]["chat_memory_length"]))
         save_audio_message(get_session_key(), "user", voice_recording["bytes"])
         save_text_message(get_session_key(), "assistant", llm_answer)
+        schedule_summary(get_session_key(), st.session_state.model_to_use)
 
     if user_input:
         if user_input.startswith("/"):
@@ -160,31 +280,37 @@ def main():
             user_input = None
 
         if user_input:
-            llm_answer = ChatAPIHandler.chat(
+            llm_answer = get_llm_answer(
+                response_container, user_input,
                 user_input=user_input,
-                chat_history=load_last_k_text_messages_ollama(
+                chat_history=load_chat_memory(
                     get_session_key(),
                     config["chat_config"]["chat_memory_length"]))
             save_text_message(get_session_key(), "user", user_input)
             save_text_message(get_session_key(), "assistant", llm_answer)
+            schedule_summary(get_session_key(),
+                             st.session_state.model_to_use)
             user_input = None
 
         if uploaded_image:
             with st.spinner("Processing image..."):
-                llm_answer = ChatAPIHandler.chat(
+                llm_answer = get_llm_answer(
+                    response_container, user_input,
                     user_input=user_input,
                     chat_history=[],
                     image=uploaded_image.getvalue())
                 save_text_message(get_session_key(), "user", user_input)
-                save_image_message(get_session_key(), "user",
-                                   uploaded_image.getvalue())
+                save_image_message(
+                    get_session_key(), "user",
+                    get_history_image(uploaded_image.getvalue()))
                 save_text_message(get_session_key(), "assistant", llm_answer)
                 user_input = None
 
         if uploaded_audio:
-            transcribed_audio = transcribe_audio(uploaded_audio.getvalue())
-            print(transcribed_audio)
-            llm_answer = ChatAPIHandler.chat(
+            transcribed_audio = transcribe_with_progress(
+                response_container, uploaded_audio.getvalue())
+            llm_answer = get_llm_answer(
+                response_container, user_input,
                 user_input=user_input + "\n" + transcribed_audio,
                 chat_history=[])
             save_text_message(get_session_key(), "user", user_input)
@@ -196,8 +322,17 @@ def main():
 
     if ((st.session_state.session_key != "new_session") !=
             (st.session_state.new_session_key is not None)):
+        response_container.empty()
         with chat_container:
-            chat_history_messages = load_messages(get_session_key())
+            session_key = get_session_key()
+            history, chat_history_messages = load_history_window(
+                session_key)
+
+            if history["has_more"] and chat_history_messages:
+                st.button("Load earlier messages",
+                          on_click=load_earlier_messages,
+                          args=(session_key,
+                                chat_history_messages[0]["message_id"]))
 
             for message in chat_history_messages:
                 with st.chat_message(
@@ -206,9 +341,10 @@ def main():
                     if message["message_type"] == "text":
                         st.write(message["content"])
                     if message["message_type"] == "image":
-                        st.image(message["content"])
+                        st.image(message["content"].read())
                     if message["message_type"] == "audio":
-                        st.audio(message["content"], format="audio/wav")
+                        st.audio(message["content"].read(),
+                                 format="audio/wav")
 
         if ((st.session_state.session_key == "new_session") and
                 (st.session_state.new_session_key is not None)):
@@ -216,5 +352,10 @@ def main():
 
 
 if __name__ == "__main__":
-    init_db()
-    main()
+    with startup_profile.step("init_db"):
+        init_db()
+    with startup_profile.step("warmup_asr_model"):
+        warmup_asr_model()
+    with startup_profile.step("main"):
+        main()
+    startup_profile.report()
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+from pathlib import Path
+from src.utils import config_loader
+
+config = config_loader.get_config()
+
+
+class BlobStore:
+    """
+    Content-addressed on-disk store for image and audio messages.
+
+    Blobs are stored once per sha256 under ``<root>/<ab>/<abcdef...>``, so
+    the same file sent twice takes the space of one.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, ref):
+        return self.root / ref[:2] / ref
+
+    def put(self, data):
+        """
+        Store ``data`` and return its reference.
+        """
+        ref = hashlib.sha256(data).hexdigest()
+        path = self.path(ref)
+        if path.exists():
+            return ref
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial
+        # blob, even with concurrent writers of the same content
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+        return ref
+
+    def get(self, ref):
+        return self.path(ref).read_bytes()
+
+    def delete(self, ref):
+        try:
+            self.path(ref).unlink()
+        except FileNotFoundError:
+            pass
+
+    def iter_refs(self):
+        if not self.root.exists():
+            return
+        for directory in self.root.iterdir():
+            if directory.is_dir():
+                for path in directory.iterdir():
+                    if path.is_file() and len(path.name) == 64:
+                        yield path.name
+
+
+class LazyBlob:
+    """
+    Handle to message media that only reads the bytes when ``read`` is
+    called, i.e. when the message is actually rendered. The bytes are not
+    kept, so cached message lists stay small.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def read(self):
+        return self._loader()
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    global _blob_store
+    with _blob_store_lock:
+        if _blob_store is None:
+            _blob_store = BlobStore(config["database"]["blob_store_path"])
+        return _blob_store
@@ -1,25 +1,24 @@
 import os
+import queue
 import sqlite3
-import streamlit as st
+import threading
 
-from pathlib import Path
-from src.utils import config_loader
+from contextlib import contextmanager
 
-PROJECT_ROOT = Path(__file__).parent.parent.parent
+from src.database.blob_store import LazyBlob, get_blob_store
+from src.database.write_queue import get_message_writer
+from src.utils import config_loader
+from src.utils.metrics import timed
 
-config = config_loader.load_config(f"{PROJECT_ROOT}/src/config/config.yaml")
+config = config_loader.get_config()
 
+_local = threading.local()
+_read_pool = None
+_read_pool_lock = threading.Lock()
 
-def init_db():
-    """
-    Initialize the SQLite database and create the necessary tables.
-    """
-    db_path = config["database"]["chat_history_path"]
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
 
-    create_messages_table = """
+def create_messages_table(cursor):
+    cursor.execute("""
     CREATE TABLE IF NOT EXISTS messages (
         message_id INTEGER PRIMARY KEY AUTOINCREMENT,
         chat_history_id TEXT NOT NULL,
@@ -28,87 +27,296 @@ def init_db():
         text_content TEXT,
         blob_content BLOB
     );
+    """)
+
+
+def add_sessions_table_and_indexes(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sessions (
+        chat_history_id TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        message_count INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    cursor.execute("""
+    INSERT OR IGNORE INTO sessions (chat_history_id, message_count)
+    SELECT chat_history_id, COUNT(*) FROM messages GROUP BY chat_history_id
+    """)
+    # Covers the history lookups by type (text history for the LLM) and
+    # the full ordered reload of a session
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_messages_session_type
+    ON messages (chat_history_id, message_type, message_id)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_messages_session
+    ON messages (chat_history_id, message_id)
+    """)
+    # Keep the sessions table in sync with every write to messages
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_messages_insert
+    AFTER INSERT ON messages
+    BEGIN
+        INSERT INTO sessions (chat_history_id, message_count)
+        VALUES (NEW.chat_history_id, 1)
+        ON CONFLICT (chat_history_id) DO UPDATE SET
+            message_count = message_count + 1,
+            updated_at = CURRENT_TIMESTAMP;
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_messages_delete
+    AFTER DELETE ON messages
+    BEGIN
+        UPDATE sessions SET message_count = message_count - 1,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE chat_history_id = OLD.chat_history_id;
+        DELETE FROM sessions
+        WHERE chat_history_id = OLD.chat_history_id
+        AND message_count <= 0;
+    END
+    """)
+
+
+def add_blob_ref_column(cursor):
+    # Media moves to the blob store; blob_content is only kept for rows
+    # that have not been converted by src.database.migrate_blobs yet
+    columns = [row[1] for row in
+               cursor.execute("PRAGMA table_info(messages)").fetchall()]
+    # Databases of earlier versions could get the column without the
+    # version bump, when the two were not yet applied atomically
+    if "blob_ref" not in columns:
+        cursor.execute("ALTER TABLE messages ADD COLUMN blob_ref TEXT")
+
+
+def add_summaries_table(cursor):
+    # Running summary of the messages up to summarized_until, see
+    # src.llm.conversation_summary
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS summaries (
+        chat_history_id TEXT PRIMARY KEY,
+        summary TEXT NOT NULL,
+        summarized_until INTEGER NOT NULL,
+        updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_delete
+    AFTER DELETE ON sessions
+    BEGIN
+        DELETE FROM summaries WHERE chat_history_id = OLD.chat_history_id;
+    END
+    """)
+
+
+# Schema migrations, applied in order. The index + 1 of the last applied
+# migration is stored in PRAGMA user_version
+MIGRATIONS = [
+    create_messages_table,
+    add_sessions_table_and_indexes,
+    add_blob_ref_column,
+    add_summaries_table,
+]
+
+
+def migrate_db(conn):
+    """
+    Bring the database schema up to date with ``MIGRATIONS``.
     """
+    (version,) = conn.execute("PRAGMA user_version").fetchone()
+    for index, migration in enumerate(MIGRATIONS[version:], start=version):
+        # sqlite3 only opens a transaction implicitly before DML, so the
+        # schema changes and the version bump are wrapped explicitly to
+        # be applied together or not at all
+        conn.execute("BEGIN")
+        try:
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {index + 1}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        print(f"Applied database migration {index + 1}: "
+              f"{migration.__name__}")
+
+
+def apply_pragmas(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    for pragma, value in config["database"].get("pragmas", {}).items():
+        conn.execute(f"PRAGMA {pragma}={value}")
 
-    cursor.execute(create_messages_table)
-    conn.commit()
+
+def init_db():
+    """
+    Initialize the SQLite database and bring its schema up to date.
+    """
+    db_path = config["database"]["chat_history_path"]
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    apply_pragmas(conn)
+    migrate_db(conn)
     conn.close()
 
 
-@st.cache_resource
-def get_database_connection():
-    """Create a thread-safe database connection"""
+def get_database_connection(check_same_thread=True):
+    """Create a database connection for reads"""
     db_path = config["database"]["chat_history_path"]
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    return sqlite3.connect(db_path, check_same_thread=False)
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+    apply_pragmas(conn)
+    return conn
 
 
-def get_db_connection():
-    if 'db_conn' not in st.session_state:
-        st.session_state.db_conn = get_database_connection()
-    return st.session_state.db_conn
+class ReadConnectionPool:
+    """
+    Bounded pool of read connections shared by all threads. Streamlit runs
+    every rerun on a new thread, so connections are handed from thread to
+    thread and keep their page cache and memory map between reruns.
+    """
 
+    def __init__(self, size):
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = get_database_connection(check_same_thread=False)
+            try:
+                yield conn
+            finally:
+                self._idle.put(conn)
+
+
+def get_read_pool():
+    global _read_pool
+    with _read_pool_lock:
+        if _read_pool is None:
+            _read_pool = ReadConnectionPool(
+                config["database"].get("read_pool_size", 8))
+        return _read_pool
+
+
+def get_writer():
+    db_path = config["database"]["chat_history_path"]
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    return get_message_writer(
+        db_path, setup_connection=apply_pragmas,
+        **config["database"].get("write_queue", {}))
+
+
+def wait_for_pending_writes(chat_history_id=None):
+    """
+    Block until the queued writes of ``chat_history_id`` (or of all
+    sessions) are committed, so reads see them.
+    """
+    if chat_history_id is None:
+        committed = get_writer().flush()
+    else:
+        committed = get_writer().wait_for_session(chat_history_id)
+    if not committed:
+        print("Timed out waiting for queued message writes, reading "
+              "without them.")
 
-def get_db_connection_and_cursor():
-    conn = get_db_connection()
-    return conn, conn.cursor()
 
+def use_thread_read_connection():
+    """
+    Give the calling thread a read connection of its own. Meant as the
+    initializer of long-lived worker threads, like the API server's, which
+    then do not compete for the shared pool.
+    """
+    _local.owns_connection = True
+
+
+@contextmanager
+def read_cursor():
+    """
+    Borrow a cursor for reads, from the thread's own connection or from the
+    shared pool. Reads run concurrently under WAL; writes go through the
+    write queue.
+    """
+    if getattr(_local, "owns_connection", False):
+        if getattr(_local, "conn", None) is None:
+            _local.conn = get_database_connection()
+        yield _local.conn.cursor()
+        return
+    with get_read_pool().connection() as conn:
+        yield conn.cursor()
 
-def get_all_chat_history_ids():
 
-    _, cursor = get_db_connection_and_cursor()
+@timed("db.get_all_chat_history_ids")
+def get_all_chat_history_ids(wait_for=None):
+    """
+    Return the ids of all sessions. Only the queued writes of the session
+    ``wait_for`` are waited for, other sessions are listed once their
+    writes are committed.
+    """
+    if wait_for is not None:
+        wait_for_pending_writes(wait_for)
 
     query = """
-            SELECT DISTINCT chat_history_id FROM messages ORDER BY
+            SELECT chat_history_id FROM sessions ORDER BY
             chat_history_id ASC
             """
-    cursor.execute(query)
+    with read_cursor() as cursor:
+        cursor.execute(query)
+        chat_history_ids = cursor.fetchall()
 
-    chat_history_ids = cursor.fetchall()
     chat_history_id_list = [item[0] for item in chat_history_ids]
 
     return chat_history_id_list
 
 
 def delete_chat_history(chat_history_id):
-    conn, cursor = get_db_connection_and_cursor()
-
-    query = "DELETE FROM messages WHERE chat_history_id = ?"
-    cursor.execute(query, (chat_history_id,))
-    conn.commit()
+    get_writer().submit(chat_history_id, delete_messages, chat_history_id)
+    wait_for_pending_writes(chat_history_id)
 
     print(f"All entries with chat_history_id {chat_history_id} \
           have been deleted.")
 
 
+def delete_messages(cursor, chat_history_id):
+    query = "DELETE FROM messages WHERE chat_history_id = ?"
+    cursor.execute(query, (chat_history_id,))
+
+
 def save_text_message(chat_history_id, sender_type, text):
-    conn, cursor = get_db_connection_and_cursor()
+    get_writer().submit(chat_history_id, insert_text_message,
+                        chat_history_id, sender_type, text)
+
 
+def insert_text_message(cursor, chat_history_id, sender_type, text):
     cursor.execute("""
                    INSERT INTO messages (chat_history_id, sender_type, \
                    message_type, text_content) VALUES (?, ?, ?, ?)
                    """,
                    (chat_history_id, sender_type, 'text', text))
 
-    conn.commit()
-
 
-def load_last_k_text_messages_ollama(chat_history_id, k):
-    conn, cursor = get_db_connection_and_cursor()
+@timed("db.load_last_k_text_messages")
+def load_last_k_text_messages_ollama(chat_history_id, k,
+                                     after_message_id=0):
+    wait_for_pending_writes(chat_history_id)
 
     query = """
-    SELECT message_id, sender_type, message_type, text_content, blob_content
+    SELECT message_id, sender_type, text_content
     FROM messages
     WHERE chat_history_id = ? AND message_type = 'text'
+    AND message_id > ?
     ORDER BY message_id DESC
     LIMIT ?
     """
-    cursor.execute(query, (chat_history_id, k))
+    with read_cursor() as cursor:
+        cursor.execute(query, (chat_history_id, after_message_id, k))
+        messages = cursor.fetchall()
 
-    messages = cursor.fetchall()
     chat_history = []
     for message in reversed(messages):
-        (_, sender_type, _, text_content, _) = message
+        (_, sender_type, text_content) = message
         chat_history.append({
             'role': sender_type,
             'content': text_content
@@ -117,55 +325,170 @@ def load_last_k_text_messages_ollama(chat_history_id, k):
     return chat_history
 
 
+def load_text_messages_after(chat_history_id, after_message_id, limit):
+    """
+    Load the oldest ``limit`` text messages newer than
+    ``after_message_id``, oldest first.
+    """
+    wait_for_pending_writes(chat_history_id)
+    with read_cursor() as cursor:
+        cursor.execute("""
+        SELECT message_id, sender_type, text_content
+        FROM messages
+        WHERE chat_history_id = ? AND message_type = 'text'
+        AND message_id > ?
+        ORDER BY message_id ASC
+        LIMIT ?
+        """, (chat_history_id, after_message_id, limit))
+        messages = cursor.fetchall()
+    return [{'message_id': message_id, 'role': sender_type,
+             'content': text_content}
+            for message_id, sender_type, text_content in messages]
+
+
+def load_summary(chat_history_id):
+    """
+    Returns:
+        tuple: The session's summary (or None) and the id of the last
+        message it covers (or 0).
+    """
+    wait_for_pending_writes(chat_history_id)
+    with read_cursor() as cursor:
+        cursor.execute("""
+        SELECT summary, summarized_until FROM summaries
+        WHERE chat_history_id = ?
+        """, (chat_history_id,))
+        return cursor.fetchone() or (None, 0)
+
+
+def save_summary(chat_history_id, summary, summarized_until):
+    get_writer().submit(chat_history_id, upsert_summary, chat_history_id,
+                        summary, summarized_until)
+
+
+def upsert_summary(cursor, chat_history_id, summary, summarized_until):
+    # Skipped if the session was deleted while it was being summarized
+    cursor.execute("""
+    INSERT INTO summaries (chat_history_id, summary, summarized_until)
+    SELECT ?, ?, ? WHERE EXISTS (
+        SELECT 1 FROM sessions WHERE chat_history_id = ?)
+    ON CONFLICT (chat_history_id) DO UPDATE SET
+        summary = excluded.summary,
+        summarized_until = excluded.summarized_until,
+        updated_at = CURRENT_TIMESTAMP
+    """, (chat_history_id, summary, summarized_until, chat_history_id))
+
+
+@timed("db.load_messages")
 def load_messages(chat_history_id):
-    _, cursor = get_db_connection_and_cursor()
+    wait_for_pending_writes(chat_history_id)
 
     query = """
     SELECT message_id, sender_type, message_type, text_content,
-    blob_content FROM messages WHERE chat_history_id = ?
+    blob_ref FROM messages WHERE chat_history_id = ?
+    ORDER BY message_id ASC
     """
-    cursor.execute(query, (chat_history_id,))
+    with read_cursor() as cursor:
+        cursor.execute(query, (chat_history_id,))
+        messages = cursor.fetchall()
 
-    messages = cursor.fetchall()
-    chat_history = []
-    for message in messages:
-        (message_id, sender_type, message_type,
-         text_content, blob_content) = message
-
-        if message_type == 'text':
-            chat_history.append(
-                {'message_id': message_id, 'sender_type': sender_type,
-                 'message_type': message_type, 'content': text_content})
-        else:
-            chat_history.append(
-                {'message_id': message_id, 'sender_type': sender_type,
-                 'message_type': message_type, 'content': blob_content})
+    return [to_message_dict(message) for message in messages]
 
-    return chat_history
 
+@timed("db.load_messages_page")
+def load_messages_page(chat_history_id, limit=None, before_message_id=None,
+                       after_message_id=None):
+    """
+    Load one page of a chat session with keyset pagination.
+
+    Args:
+        chat_history_id (str): The chat session.
+        limit (int, optional): The maximum number of messages. With
+            ``before_message_id`` (or no bound at all) the newest matching
+            messages are returned.
+        before_message_id (int, optional): Only messages older than this.
+        after_message_id (int, optional): Only messages newer than this.
+
+    Returns:
+        list: The messages in ascending ``message_id`` order.
+    """
+    wait_for_pending_writes(chat_history_id)
+
+    conditions = ["chat_history_id = ?"]
+    params = [chat_history_id]
+    if before_message_id is not None:
+        conditions.append("message_id < ?")
+        params.append(before_message_id)
+    if after_message_id is not None:
+        conditions.append("message_id > ?")
+        params.append(after_message_id)
+    newest_first = after_message_id is None
+
+    query = f"""
+    SELECT message_id, sender_type, message_type, text_content,
+    blob_ref FROM messages WHERE {" AND ".join(conditions)}
+    ORDER BY message_id {"DESC" if newest_first else "ASC"}
+    """
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    with read_cursor() as cursor:
+        cursor.execute(query, params)
+        messages = cursor.fetchall()
 
-def save_image_message(chat_history_id, sender_type, image_bytes):
-    conn, cursor = get_db_connection_and_cursor()
+    if newest_first:
+        messages.reverse()
+    return [to_message_dict(message) for message in messages]
 
-    cursor.execute("""
-                   INSERT INTO messages (chat_history_id, sender_type, \
-                   message_type, blob_content) VALUES (?, ?, ?, ?)
-                   """,
-                   (chat_history_id, sender_type,
-                    'image',
-                    sqlite3.Binary(image_bytes)))
 
-    conn.commit()
+def to_message_dict(message):
+    (message_id, sender_type, message_type,
+     text_content, blob_ref) = message
 
+    if message_type == 'text':
+        return {'message_id': message_id, 'sender_type': sender_type,
+                'message_type': message_type, 'content': text_content}
+    return {'message_id': message_id, 'sender_type': sender_type,
+            'message_type': message_type,
+            'content': get_media_handle(message_id, blob_ref)}
 
-def save_audio_message(chat_history_id, sender_type, audio_bytes):
-    conn, cursor = get_db_connection_and_cursor()
 
+def get_media_handle(message_id, blob_ref):
+    if blob_ref is not None:
+        return LazyBlob(lambda: get_blob_store().get(blob_ref))
+    return LazyBlob(lambda: load_blob_content(message_id))
+
+
+def load_blob_content(message_id):
+    with read_cursor() as cursor:
+        cursor.execute(
+            "SELECT blob_content FROM messages WHERE message_id = ?",
+            (message_id,))
+        return cursor.fetchone()[0]
+
+
+def save_blob_message(chat_history_id, sender_type, message_type,
+                      blob_bytes):
+    get_writer().submit(chat_history_id, insert_blob_message,
+                        chat_history_id, sender_type, message_type,
+                        blob_bytes)
+
+
+def insert_blob_message(cursor, chat_history_id, sender_type, message_type,
+                        blob_bytes):
+    # Runs on the writer thread, so the blob file write is off the request
+    # path as well
+    blob_ref = get_blob_store().put(blob_bytes)
     cursor.execute("""
                    INSERT INTO messages (chat_history_id, sender_type, \
-                   message_type, blob_content) VALUES (?, ?, ?, ?)
+                   message_type, blob_ref) VALUES (?, ?, ?, ?)
                    """,
-                   (chat_history_id, sender_type, 'audio',
-                    sqlite3.Binary(audio_bytes)))
+                   (chat_history_id, sender_type, message_type, blob_ref))
 
-    conn.commit()
+
+def save_image_message(chat_history_id, sender_type, image_bytes):
+    save_blob_message(chat_history_id, sender_type, 'image', image_bytes)
+
+
+def save_audio_message(chat_history_id, sender_type, audio_bytes):
+    save_blob_message(chat_history_id, sender_type, 'audio', audio_bytes)
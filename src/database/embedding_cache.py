@@ -0,0 +1,203 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+
+
+def get_cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def to_float32(vector):
+    return array("f", vector).tolist()
+
+
+class EmbeddingDiskCache:
+    """
+    SQLite-backed embedding store, trimmed to ``max_entries`` by evicting
+    the least recently used vectors. The trim runs once every
+    ``trim_every`` inserted vectors rather than on every insert, so the
+    store may briefly exceed ``max_entries`` by that much.
+    """
+
+    def __init__(self, path, max_entries, trim_every=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.trim_every = trim_every or max(100, max_entries // 100)
+        self._inserts_since_trim = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS embeddings (
+            cache_key TEXT PRIMARY KEY,
+            vector BLOB NOT NULL,
+            last_used REAL NOT NULL
+        )
+        """)
+        self.conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_embeddings_last_used
+        ON embeddings (last_used)
+        """)
+        self.conn.commit()
+
+    def get_many(self, keys):
+        with self._lock:
+            return self._get_many(keys)
+
+    def _get_many(self, keys):
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT cache_key, vector FROM embeddings "
+                f"WHERE cache_key IN ({placeholders})", batch).fetchall()
+            for cache_key, vector in rows:
+                found[cache_key] = array("f", vector).tolist()
+        if found:
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE cache_key = ?",
+                [(now, cache_key) for cache_key in found])
+            self.conn.commit()
+        return found
+
+    def put_many(self, items):
+        rows = [(cache_key, array("f", vector).tobytes(), time.time())
+                for cache_key, vector in items]
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings "
+                "(cache_key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+            self._inserts_since_trim += len(rows)
+            if self._inserts_since_trim >= self.trim_every:
+                self._trim()
+
+    def trim(self):
+        with self._lock:
+            self._trim()
+
+    def _trim(self):
+        self._inserts_since_trim = 0
+        (count,) = self.conn.execute(
+            "SELECT COUNT(*) FROM embeddings").fetchone()
+        if count <= self.max_entries:
+            return
+        self.conn.execute("""
+        DELETE FROM embeddings WHERE cache_key IN (
+            SELECT cache_key FROM embeddings ORDER BY last_used ASC LIMIT ?
+        )
+        """, (count - self.max_entries,))
+        self.conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self.conn.execute(
+                "SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated texts from a cache.
+
+    Vectors are keyed by (embedding model, text hash) and looked up in an
+    in-memory LRU first, then in the on-disk store. Only the misses are
+    sent to the wrapped embeddings, in a single call. Vectors are rounded
+    to float32, the precision of the disk store, so a text gets the same
+    vector from either tier. Hits and misses are counted per distinct
+    text of a call.
+    """
+
+    def __init__(self, embeddings, model, memory_max_entries=10000,
+                 disk_cache=None):
+        self.embeddings = embeddings
+        self.model = model
+        self.memory_max_entries = memory_max_entries
+        self.disk_cache = disk_cache
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def embed_documents(self, texts):
+        keys = [get_cache_key(self.model, text) for text in texts]
+        vectors = self._get_cached(keys)
+
+        missing = {}
+        for index, key in enumerate(keys):
+            if key not in vectors:
+                missing.setdefault(key, texts[index])
+        if missing:
+            new_vectors = self.embeddings.embed_documents(
+                list(missing.values()))
+            computed = dict(zip(missing.keys(),
+                                map(to_float32, new_vectors)))
+            self._put(computed)
+            vectors.update(computed)
+
+        with self._lock:
+            self.stats["misses"] += len(missing)
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        key = get_cache_key(self.model, text)
+        vectors = self._get_cached([key])
+        if key not in vectors:
+            vectors[key] = to_float32(self.embeddings.embed_query(text))
+            self._put({key: vectors[key]})
+            with self._lock:
+                self.stats["misses"] += 1
+        return vectors[key]
+
+    def _get_cached(self, keys):
+        vectors = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    vectors[key] = self._memory[key]
+            self.stats["memory_hits"] += len(vectors)
+
+        disk_keys = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if self.disk_cache is not None and disk_keys:
+            # The disk store has its own lock, memory lookups of other
+            # threads do not wait for its I/O
+            found = self.disk_cache.get_many(disk_keys)
+            with self._lock:
+                self.stats["disk_hits"] += len(found)
+                self._remember(found)
+            vectors.update(found)
+        return vectors
+
+    def _put(self, vectors):
+        with self._lock:
+            self._remember(vectors)
+        if self.disk_cache is not None:
+            self.disk_cache.put_many(vectors.items())
+
+    def _remember(self, vectors):
+        for key, vector in vectors.items():
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        if self.disk_cache is not None:
+            stats["disk_entries"] = len(self.disk_cache)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["disk_hits"]) / lookups
+            if lookups else 0.0)
+        return stats
@@ -0,0 +1,87 @@
+"""
+Move image and audio bytes out of the messages table into the blob store.
+
+Usage:
+    python -m src.database.migrate_blobs [--db PATH] [--vacuum] [--gc]
+"""
+import argparse
+import sqlite3
+
+from src.database.blob_store import get_blob_store
+from src.database.db_operations import apply_pragmas, config, migrate_db
+
+
+def migrate_blobs(conn, batch_size=100):
+    """
+    Store every remaining ``blob_content`` in the blob store and replace
+    it with a ``blob_ref``. Each batch is committed on its own, so the
+    migration can be interrupted and resumed.
+
+    Returns:
+        int: The number of converted messages.
+    """
+    blob_store = get_blob_store()
+    converted = 0
+    while True:
+        rows = conn.execute("""
+        SELECT message_id, blob_content FROM messages
+        WHERE blob_content IS NOT NULL AND blob_ref IS NULL
+        LIMIT ?
+        """, (batch_size,)).fetchall()
+        if not rows:
+            return converted
+        with conn:
+            conn.executemany(
+                "UPDATE messages SET blob_ref = ?, blob_content = NULL "
+                "WHERE message_id = ?",
+                [(blob_store.put(bytes(blob_content)), message_id)
+                 for message_id, blob_content in rows])
+        converted += len(rows)
+        print(f"Converted {converted} messages.")
+
+
+def collect_garbage(conn):
+    """
+    Delete blobs that are no longer referenced by any message, e.g. after
+    a chat session was deleted.
+
+    Returns:
+        int: The number of deleted blobs.
+    """
+    blob_store = get_blob_store()
+    referenced = {blob_ref for (blob_ref,) in conn.execute(
+        "SELECT DISTINCT blob_ref FROM messages WHERE blob_ref IS NOT NULL")}
+    deleted = 0
+    for blob_ref in list(blob_store.iter_refs()):
+        if blob_ref not in referenced:
+            blob_store.delete(blob_ref)
+            deleted += 1
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--db",
+                        default=config["database"]["chat_history_path"],
+                        help="Path of the chat history database.")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--vacuum", action="store_true",
+                        help="Reclaim the freed space afterwards.")
+    parser.add_argument("--gc", action="store_true",
+                        help="Delete unreferenced blobs afterwards.")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    apply_pragmas(conn)
+    migrate_db(conn)
+    print(f"Moved {migrate_blobs(conn, args.batch_size)} blobs to "
+          f"{get_blob_store().root}.")
+    if args.gc:
+        print(f"Deleted {collect_garbage(conn)} unreferenced blobs.")
+    if args.vacuum:
+        conn.execute("VACUUM")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,163 @@
 import chromadb
+import threading
 
 from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
-from pathlib import Path
+from langchain_core.embeddings import Embeddings
+from src.database.embedding_cache import CachedEmbeddings, EmbeddingDiskCache
+from src.llm.model_residency import get_keep_alive, get_residency_manager
+from src.llm.ollama_client import get_ollama_client
+from src.llm.request_scheduler import (BACKGROUND, INTERACTIVE,
+                                       get_request_scheduler)
 from src.utils import config_loader
+from src.utils.metrics import span
 
-PROJECT_ROOT = Path(__file__).parent.parent
+config = config_loader.get_config()
 
-config = config_loader.load_config(f"{PROJECT_ROOT}/config/config.yaml")
+
+class OllamaClientEmbeddings(Embeddings):
+    """
+    Ollama embeddings sent through the shared, pooled ``OllamaClient``
+    instead of a separate HTTP client per ``OllamaEmbeddings`` instance.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def embed_documents(self, texts):
+        # Document batches come from ingestion and yield to chat
+        return self.embed(texts, BACKGROUND)
+
+    def embed_query(self, text):
+        return self.embed([text], INTERACTIVE)[0]
+
+    def embed(self, texts, priority):
+        if not texts:
+            return []
+        with get_request_scheduler().slot(self.model, priority):
+            with span("embedding", model=self.model,
+                      texts=len(texts)) as fields:
+                response = get_ollama_client().post(
+                    "/api/embed", json={"model": self.model,
+                                        "input": list(texts),
+                                        "keep_alive": get_keep_alive()})
+                json_response = response.json()
+                fields["prompt_tokens"] = json_response.get(
+                    "prompt_eval_count")
+        if "error" in json_response.keys():
+            raise RuntimeError("OLLAMA ERROR: " + json_response["error"])
+        get_residency_manager().record_response(self.model, json_response)
+        return json_response["embeddings"]
+
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
 
 
 def get_ollama_embeddings():
-    return OllamaEmbeddings(model=config["ollama"]["embedding_model"],
-                            base_url=config["ollama"]["base_url"])
+    """
+    Return the process-wide embeddings, wrapped in a ``CachedEmbeddings``
+    unless the cache is disabled in the config.
+    """
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            model = config["ollama"]["embedding_model"]
+            cache_config = config.get("embedding_cache", {})
+            _embeddings = OllamaClientEmbeddings(model=model)
+            if cache_config.get("enabled", True):
+                disk_cache = None
+                if cache_config.get("path"):
+                    disk_cache = EmbeddingDiskCache(
+                        cache_config["path"],
+                        cache_config.get("disk_max_entries", 500000))
+                _embeddings = CachedEmbeddings(
+                    _embeddings, model,
+                    memory_max_entries=cache_config.get(
+                        "memory_max_entries", 10000),
+                    disk_cache=disk_cache)
+        return _embeddings
+
+
+class VectorStoreManager:
+    """
+    Long-lived owner of the Chroma persistent client and collection
+    handles.
+
+    The client is opened once per process and every collection wrapper is
+    reused until ``invalidate`` is called, e.g. after the config or the
+    collections changed. All methods are thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._client = None
+        self._client_path = None
+        self._stores = {}
+
+    def get_client(self):
+        with self._lock:
+            path = config["chromadb"]["chromadb_path"]
+            if self._client is None or self._client_path != path:
+                self._stores.clear()
+                self._client = chromadb.PersistentClient(path)
+                self._client_path = path
+            return self._client
+
+    def get_vectordb(self, collection_name=None, embeddings=None):
+        """
+        Return the cached LangChain ``Chroma`` wrapper for a collection.
+        """
+        collection_name = (collection_name or
+                           config["chromadb"]["collection_name"])
+        embeddings = embeddings or get_ollama_embeddings()
+        with self._lock:
+            client = self.get_client()
+            key = (collection_name, id(embeddings))
+            if key not in self._stores:
+                self._stores[key] = Chroma(
+                    client=client,
+                    collection_name=collection_name,
+                    embedding_function=embeddings,
+                )
+            return self._stores[key]
+
+    def get_collection(self, collection_name=None):
+        """
+        Return the raw chromadb collection behind ``get_vectordb``, for
+        writes with precomputed embeddings and metadata-only updates.
+        """
+        collection_name = (collection_name or
+                           config["chromadb"]["collection_name"])
+        with self._lock:
+            self.get_vectordb(collection_name)
+            return self.get_client().get_collection(collection_name)
+
+    def invalidate(self, collection_name=None):
+        """
+        Drop cached handles for ``collection_name``, or everything
+        including the client when no name is given.
+        """
+        with self._lock:
+            if collection_name is None:
+                self._stores.clear()
+                self._client = None
+                self._client_path = None
+                return
+            for key in [key for key in self._stores
+                        if key[0] == collection_name]:
+                del self._stores[key]
+
+
+vector_store_manager = VectorStoreManager()
+
+
+def load_vectordb(embeddings=None):
+    return vector_store_manager.get_vectordb(embeddings=embeddings)
 
 
-def load_vectordb(embeddings=get_ollama_embeddings()):
-    persistent_client = (
-        chromadb.PersistentClient(config["chromadb"]["chromadb_path"])
-    )
+def get_collection():
+    return vector_store_manager.get_collection()
 
-    langchain_chroma = Chroma(
-        client=persistent_client,
-        collection_name=config["chromadb"]["collection_name"],
-        embedding_function=embeddings,
-    )
 
-    return langchain_chroma
+def invalidate_vectordb(collection_name=None):
+    vector_store_manager.invalidate(collection_name)
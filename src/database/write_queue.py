@@ -0,0 +1,179 @@
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+
+from src.utils.metrics import span
+
+_STOP = object()
+
+
+class WriterFailedError(RuntimeError):
+    """Raised for writes to and waits on a message writer that failed."""
+
+
+class MessageWriter:
+    """
+    Write-behind queue for chat message writes.
+
+    Writes are queued from the request thread and applied by one
+    background thread, which groups everything queued within
+    ``flush_interval_ms`` (across turns and sessions) into a single
+    transaction. The queue is bounded, so producers block once
+    ``max_queue_size`` writes are pending.
+
+    Readers call ``wait_for_session`` before querying a session, which
+    guarantees they see their own writes. Waits give up after
+    ``wait_timeout_s``. If the writer thread fails, e.g. because the
+    database cannot be opened, the pending and later writes fail and
+    waiting raises ``WriterFailedError`` instead of blocking forever.
+    """
+
+    def __init__(self, db_path, setup_connection=None, max_queue_size=1000,
+                 max_batch_size=200, flush_interval_ms=20, wait_timeout_s=30):
+        self.db_path = db_path
+        self.setup_connection = setup_connection
+        self.max_batch_size = max_batch_size
+        self.flush_interval_s = flush_interval_ms / 1000
+        self.wait_timeout_s = wait_timeout_s
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._pending = {}
+        self._pending_total = 0
+        self._error = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run,
+                                        name="message-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, chat_history_id, write, *args):
+        """
+        Queue ``write(cursor, *args)`` for ``chat_history_id``.
+        """
+        with self._condition:
+            self._raise_if_failed()
+            self._pending[chat_history_id] = (
+                self._pending.get(chat_history_id, 0) + 1)
+            self._pending_total += 1
+        self._queue.put((chat_history_id, write, args))
+
+    def wait_for_session(self, chat_history_id, timeout=None):
+        """
+        Block until the queued writes of ``chat_history_id`` are
+        committed, for at most ``timeout`` (default ``wait_timeout_s``)
+        seconds.
+
+        Returns:
+            bool: False if the wait timed out.
+        """
+        return self._wait(lambda: not self._pending.get(chat_history_id),
+                          timeout)
+
+    def flush(self, timeout=None):
+        """Block until every queued write has been committed."""
+        return self._wait(lambda: self._pending_total == 0, timeout)
+
+    def _wait(self, predicate, timeout):
+        with self._condition:
+            done = self._condition.wait_for(
+                lambda: predicate() or self._error is not None,
+                self.wait_timeout_s if timeout is None else timeout)
+            self._raise_if_failed()
+            return done
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise WriterFailedError(
+                f"The message writer stopped: {self._error}"
+            ) from self._error
+
+    def close(self, timeout=10):
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            self._process_queue()
+        except Exception as e:
+            print(f"Message writer failed: {e}")
+            with self._condition:
+                self._error = e
+                self._pending.clear()
+                self._pending_total = 0
+                self._condition.notify_all()
+            # Drop what is queued, so producers blocked on a full queue
+            # get to see the error
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+    def _process_queue(self):
+        conn = sqlite3.connect(self.db_path)
+        if self.setup_connection is not None:
+            self.setup_connection(conn)
+
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval_s
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+                batch = [job for job in batch if job is not _STOP]
+            if batch:
+                self._write(conn, batch)
+        conn.close()
+
+    def _write(self, conn, batch):
+        try:
+            with span("db.write_batch", writes=len(batch)), conn:
+                cursor = conn.cursor()
+                for _, write, args in batch:
+                    write(cursor, *args)
+        except Exception as e:
+            # Retry one by one so a single bad write does not drop the
+            # rest of the batch
+            print(f"Batched message write failed ({e}), retrying singly.")
+            for _, write, args in batch:
+                try:
+                    with conn:
+                        write(conn.cursor(), *args)
+                except Exception as e:
+                    print(f"Message write {write.__name__} failed: {e}")
+        finally:
+            with self._condition:
+                for chat_history_id, _, _ in batch:
+                    self._pending[chat_history_id] -= 1
+                    if not self._pending[chat_history_id]:
+                        del self._pending[chat_history_id]
+                self._pending_total -= len(batch)
+                self._condition.notify_all()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_message_writer(db_path, setup_connection=None, **options):
+    """
+    Return the process-wide ``MessageWriter``, starting it on first use.
+    It is flushed and stopped when the interpreter exits.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = MessageWriter(db_path, setup_connection, **options)
+            atexit.register(_writer.close)
+        return _writer
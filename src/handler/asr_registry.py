@@ -0,0 +1,233 @@
+import gc
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from concurrent.futures import Future
+from src.utils import config_loader
+from src.utils.metrics import span
+
+config = config_loader.get_config()
+logger = logging.getLogger(__name__)
+
+WARMUP_SAMPLE_RATE = 16000
+
+
+class ASRModelRegistry:
+    """
+    Process-wide registry that keeps Whisper pipelines resident.
+
+    A pipeline is built the first time a model is requested and reused by
+    every Streamlit rerun and session afterwards. Transcription requests go
+    through a single worker thread which groups requests arriving within
+    ``batch_wait_ms`` of each other into one batched ``pipe(...)`` call and
+    unloads pipelines that have been idle for ``idle_unload_s`` seconds.
+    """
+
+    def __init__(self, asr_config=None):
+        asr_config = asr_config or config.get("asr", {})
+        self.device = asr_config.get("device", "cpu")
+        self.chunk_length_s = asr_config.get("chunk_length_s", 30)
+        self.idle_unload_s = asr_config.get("idle_unload_s", 900)
+        self.max_batch_size = max(1, asr_config.get("max_batch_size", 4))
+        self.batch_wait_s = asr_config.get("batch_wait_ms", 50) / 1000
+
+        self._pipelines = {}
+        self._last_used = {}
+        # Model name -> Future of a pipeline being loaded
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._worker = None
+
+    def get_pipeline(self, model_name):
+        """
+        Return the pipeline for ``model_name``, loading it on first use.
+
+        The model is loaded outside the registry lock, so requests for
+        loaded models are not held up by it. Concurrent callers of a model
+        that is being loaded wait for that load instead of starting their
+        own.
+        """
+        with self._lock:
+            pipe = self._pipelines.get(model_name)
+            if pipe is not None:
+                self._last_used[model_name] = time.monotonic()
+                return pipe
+            loading = self._loading.get(model_name)
+            is_loader = loading is None
+            if is_loader:
+                loading = self._loading[model_name] = Future()
+
+        if not is_loader:
+            return loading.result()
+
+        try:
+            pipe = self._load(model_name)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[model_name]
+            loading.set_exception(e)
+            raise
+        with self._lock:
+            self._pipelines[model_name] = pipe
+            self._last_used[model_name] = time.monotonic()
+            del self._loading[model_name]
+        loading.set_result(pipe)
+        return pipe
+
+    def _load(self, model_name):
+        from transformers import pipeline
+
+        logger.info("Loading ASR model %s on %s", model_name, self.device)
+        return pipeline(
+            task="automatic-speech-recognition",
+            model=model_name,
+            chunk_length_s=self.chunk_length_s,
+            device=self.device,
+        )
+
+    def is_loaded(self, model_name):
+        with self._lock:
+            return model_name in self._pipelines
+
+    def warmup(self, model_name, background=False):
+        """
+        Load ``model_name`` and run it once on a second of silence so the
+        first real request does not pay for lazy initialisation.
+        """
+        if background:
+            threading.Thread(target=self.warmup, args=(model_name,),
+                             daemon=True).start()
+            return
+        if self.is_loaded(model_name):
+            return
+        silence = np.zeros(WARMUP_SAMPLE_RATE, dtype=np.float32)
+        self.get_pipeline(model_name)(
+            {"raw": silence, "sampling_rate": WARMUP_SAMPLE_RATE},
+            batch_size=1)
+        logger.info("ASR model %s warmed up", model_name)
+
+    def unload(self, model_name):
+        with self._lock:
+            pipe = self._pipelines.pop(model_name, None)
+            self._last_used.pop(model_name, None)
+        if pipe is None:
+            return
+        del pipe
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        logger.info("Unloaded idle ASR model %s", model_name)
+
+    def transcribe(self, model_name, audio_input):
+        """
+        Queue ``audio_input`` for transcription and block until its batch
+        has been processed.
+
+        Args:
+            model_name (str): The Whisper model to use.
+            audio_input: Anything the ASR pipeline accepts for a single
+                input (array or ``{"raw": ..., "sampling_rate": ...}``).
+
+        Returns:
+            str: The transcribed text.
+        """
+        return self.submit(model_name, audio_input).result()
+
+    def submit(self, model_name, audio_input):
+        future = Future()
+        self._ensure_worker()
+        self._requests.put((model_name, audio_input, future))
+        return future
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="asr-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        idle_poll_s = min(60, max(1, self.idle_unload_s / 4))
+        while True:
+            try:
+                first = self._requests.get(timeout=idle_poll_s)
+            except queue.Empty:
+                self._unload_idle()
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.batch_wait_s
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            by_model = {}
+            for request in batch:
+                by_model.setdefault(request[0], []).append(request)
+            for model_name, requests in by_model.items():
+                self._run_batch(model_name, requests)
+
+    def _run_batch(self, model_name, requests):
+        try:
+            pipe = self.get_pipeline(model_name)
+            inputs = [audio_input for _, audio_input, _ in requests]
+            with span("asr.batch", model=model_name,
+                      batch_size=len(inputs)):
+                outputs = pipe(inputs, batch_size=len(inputs))
+        except Exception as e:
+            for _, _, future in requests:
+                future.set_exception(e)
+            return
+        finally:
+            with self._lock:
+                if model_name in self._pipelines:
+                    self._last_used[model_name] = time.monotonic()
+
+        for (_, _, future), output in zip(requests, outputs):
+            future.set_result(output["text"])
+
+    def _unload_idle(self):
+        if not self.idle_unload_s:
+            return
+        now = time.monotonic()
+        with self._lock:
+            idle_models = [
+                model_name
+                for model_name, last_used in self._last_used.items()
+                if now - last_used > self.idle_unload_s]
+        for model_name in idle_models:
+            self.unload(model_name)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_asr_registry():
+    """Return the process-wide ``ASRModelRegistry``."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ASRModelRegistry()
+        return _registry
+
+
+def warmup_asr_model(background=True):
+    """Warm up the configured Whisper model if enabled in the config."""
+    if not config.get("asr", {}).get("warmup_on_startup", False):
+        return
+    get_asr_registry().warmup(config["whisper_model"], background=background)
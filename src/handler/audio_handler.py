@@ -1,70 +1,240 @@
-import io
-import librosa
-import os
+import numpy as np
 import subprocess
+import threading
+import time
 
-from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from src.handler.asr_registry import get_asr_registry
+from src.utils.metrics import record_span
 from src.utils.utils import timeit
 from src.utils import config_loader
-from transformers import pipeline
 
-PROJECT_ROOT = Path(__file__).parent.parent
+config = config_loader.get_config()
 
-config = config_loader.load_config(f"{PROJECT_ROOT}/config/config.yaml")
+# Whisper's feature extractor expects 16 kHz mono input
+WHISPER_SAMPLE_RATE = 16000
 
+_decode_pool = ThreadPoolExecutor(
+    max_workers=config.get("audio", {}).get("ffmpeg_workers", 2),
+    thread_name_prefix="ffmpeg-decode")
 
-def convert_webm_to_wav_ffmpeg(audio_bytes):
-    # Save the WebM bytes to a file
-    with open("temp_audio.webm", "wb") as f:
-        f.write(audio_bytes)
 
-    # Use FFmpeg to convert WebM to WAV
+def decode_audio_ffmpeg(audio_bytes, sample_rate=WHISPER_SAMPLE_RATE):
+    """
+    Decode any ffmpeg-readable audio (WebM, WAV, MP3, OGG, ...) into mono
+    float32 PCM at ``sample_rate`` without touching the disk.
+
+    The encoded bytes are piped into ffmpeg's stdin and the raw 16-bit PCM
+    is read back from its stdout, so concurrent recordings never share
+    files.
+
+    Args:
+        audio_bytes (bytes): The encoded audio.
+        sample_rate (int): The target sample rate.
+
+    Returns:
+        np.ndarray: The waveform, scaled to [-1, 1].
+    """
     result = subprocess.run(
-        ["ffmpeg", "-fflags", "+igndts", "-i", "temp_audio.webm", "-c:a",
-         "pcm_s16le", "temp_audio.wav"],
+        ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+         "-fflags", "+igndts", "-i", "pipe:0",
+         "-f", "s16le", "-acodec", "pcm_s16le",
+         "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+        input=audio_bytes,
         capture_output=True
     )
 
     if result.returncode != 0:
         print(result.stderr.decode())
-        raise RuntimeError("FFmpeg failed to convert WebM to WAV")
-
-    # Read the WAV file back into memory
-    with open("temp_audio.wav", "rb") as f:
-        wav_data = f.read()
-
-    wav_io = io.BytesIO(wav_data)
-
-    # Clean up the temp files
-    os.remove("temp_audio.webm")
-    os.remove("temp_audio.wav")
+        raise RuntimeError("FFmpeg failed to decode audio")
 
-    return wav_io
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768
 
 
 def convert_bytes_to_array(audio_bytes):
-    try:
-        audio, sample_rate = librosa.load(audio_bytes)
-    except Exception:
-        print("Audio error, trying to convert to wav.")
-        wav_io = convert_webm_to_wav_ffmpeg(audio_bytes)
-        audio, sample_rate = librosa.load(wav_io)
+    """
+    Decode ``audio_bytes`` on the ffmpeg worker pool.
 
-    print(sample_rate)
-    return audio
+    Returns:
+        dict: The waveform in the input format of the ASR pipeline.
+    """
+    audio = _decode_pool.submit(decode_audio_ffmpeg, audio_bytes).result()
+    return {"raw": audio, "sampling_rate": WHISPER_SAMPLE_RATE}
 
 
 @timeit
 def transcribe_audio(audio_bytes):
-    device = "cpu"
-    pipe = pipeline(
-        task="automatic-speech-recognition",
-        model=config["whisper_model"],
-        chunk_length_s=30,
-        device=device,
-    )
-
     audio_array = convert_bytes_to_array(audio_bytes)
-    prediction = pipe(audio_array, batch_size=1)["text"]
+    prediction = get_asr_registry().transcribe(
+        config["whisper_model"], audio_array)
 
     return prediction
+
+
+def get_long_form_config():
+    return config.get("audio", {}).get("long_form", {})
+
+
+def iter_decoded_blocks(audio_bytes, sample_rate=WHISPER_SAMPLE_RATE,
+                        block_s=10):
+    """
+    Decode ``audio_bytes`` with ffmpeg and yield the waveform in blocks of
+    ``block_s`` seconds as they are decoded, so a long recording is never
+    held in memory as a whole.
+
+    Yields:
+        np.ndarray: The next block, mono float32 scaled to [-1, 1].
+    """
+    process = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+         "-fflags", "+igndts", "-i", "pipe:0",
+         "-f", "s16le", "-acodec", "pcm_s16le",
+         "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE)
+
+    def feed():
+        # Written from a thread so ffmpeg's output can be read meanwhile
+        try:
+            process.stdin.write(audio_bytes)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    block_bytes = int(block_s * sample_rate) * 2
+    finished = False
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                finished = True
+                break
+            yield np.frombuffer(data[:len(data) // 2 * 2],
+                                np.int16).astype(np.float32) / 32768
+    finally:
+        if not finished:
+            # The consumer stopped early
+            process.kill()
+        process.stdout.close()
+        feeder.join()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        returncode = process.wait()
+    if returncode != 0:
+        print(stderr.decode())
+        raise RuntimeError("FFmpeg failed to decode audio")
+
+
+def iter_speech_segments(blocks, sample_rate=WHISPER_SAMPLE_RATE,
+                         frame_ms=30, silence_threshold_db=-40,
+                         min_silence_ms=400, min_segment_s=10,
+                         max_segment_s=28):
+    """
+    Split a stream of waveform blocks into speech segments with an energy
+    based voice-activity detection.
+
+    A segment is cut at the first pause of ``min_silence_ms`` once it is
+    ``min_segment_s`` long, and at ``max_segment_s`` at the latest, which
+    keeps every segment within one Whisper window. Stretches of silence
+    are dropped rather than sent to the model.
+
+    Yields:
+        tuple: The segment's start time in seconds and its waveform.
+    """
+    frame_size = int(sample_rate * frame_ms / 1000)
+    threshold = 10 ** (silence_threshold_db / 20)
+    min_silence_frames = max(1, min_silence_ms // frame_ms)
+    min_segment_frames = int(min_segment_s * 1000 / frame_ms)
+    max_segment_frames = int(max_segment_s * 1000 / frame_ms)
+
+    frames = []
+    segment_start = 0
+    frame_index = 0
+    silent_run = 0
+    has_speech = False
+    remainder = np.zeros(0, dtype=np.float32)
+    for block in blocks:
+        block = np.concatenate([remainder, block])
+        usable = len(block) // frame_size * frame_size
+        remainder = block[usable:]
+        for frame in block[:usable].reshape(-1, frame_size):
+            if not frames:
+                segment_start = frame_index
+            frames.append(frame)
+            frame_index += 1
+            if np.sqrt(np.mean(frame * frame)) < threshold:
+                silent_run += 1
+            else:
+                silent_run = 0
+                has_speech = True
+
+            if not has_speech and silent_run >= min_silence_frames:
+                # Leading silence, nothing to transcribe yet
+                frames = []
+                silent_run = 0
+            elif ((silent_run >= min_silence_frames and
+                   len(frames) >= min_segment_frames) or
+                    len(frames) >= max_segment_frames):
+                speech = frames[:len(frames) - silent_run] or frames
+                yield (segment_start * frame_ms / 1000,
+                       np.concatenate(speech))
+                frames = []
+                silent_run = 0
+                has_speech = False
+
+    if len(remainder):
+        frames.append(remainder)
+    if frames and has_speech:
+        yield segment_start * frame_ms / 1000, np.concatenate(frames)
+
+
+def transcribe_long_audio(audio_bytes):
+    """
+    Transcribe a long recording segment by segment.
+
+    The file is decoded as a stream and split at pauses; the segments are
+    queued on the ASR registry, which batches them, with at most
+    ``max_in_flight`` waiting at a time.
+
+    Yields:
+        dict: ``start_s``, ``end_s`` and ``text`` of every segment, in
+        order, as soon as it and all earlier segments are transcribed.
+    """
+    long_form_config = get_long_form_config()
+    blocks = iter_decoded_blocks(
+        audio_bytes, block_s=long_form_config.get("block_s", 10))
+    segments = iter_speech_segments(
+        blocks,
+        frame_ms=long_form_config.get("frame_ms", 30),
+        silence_threshold_db=long_form_config.get("silence_threshold_db",
+                                                  -40),
+        min_silence_ms=long_form_config.get("min_silence_ms", 400),
+        min_segment_s=long_form_config.get("min_segment_s", 10),
+        max_segment_s=long_form_config.get("max_segment_s", 28))
+    max_in_flight = long_form_config.get("max_in_flight", 8)
+
+    registry = get_asr_registry()
+    model_name = config["whisper_model"]
+    start_time = time.perf_counter()
+    audio_s = 0.0
+    in_flight = deque()
+    for start_s, waveform in segments:
+        end_s = start_s + len(waveform) / WHISPER_SAMPLE_RATE
+        audio_s += end_s - start_s
+        in_flight.append((start_s, end_s, registry.submit(
+            model_name, {"raw": waveform,
+                         "sampling_rate": WHISPER_SAMPLE_RATE})))
+        while in_flight and (len(in_flight) >= max_in_flight or
+                             in_flight[0][2].done()):
+            start_s, end_s, future = in_flight.popleft()
+            yield {"start_s": start_s, "end_s": end_s,
+                   "text": future.result()}
+    while in_flight:
+        start_s, end_s, future = in_flight.popleft()
+        yield {"start_s": start_s, "end_s": end_s, "text": future.result()}
+    record_span("asr.long_form", time.perf_counter() - start_time,
+                model=model_name, audio_s=audio_s)
@@ -0,0 +1,152 @@
+import hashlib
+import io
+import threading
+
+from collections import OrderedDict
+from src.utils import config_loader
+from src.utils.metrics import span
+from src.utils.utils import convert_bytes_to_base64
+
+config = config_loader.get_config()
+
+
+def get_image_config():
+    return config.get("image_processing", {})
+
+
+def get_target_size(model):
+    """
+    Return the longest side images are downsized to for ``model``, from
+    the longest matching prefix in ``image_processing.models``.
+    """
+    image_config = get_image_config()
+    model_sizes = image_config.get("models", {})
+    matches = [prefix for prefix in model_sizes if model.startswith(prefix)]
+    if matches:
+        return model_sizes[max(matches, key=len)]
+    return image_config.get("default_max_side", 1024)
+
+
+def resize_image(image_bytes, max_side, quality):
+    """
+    Downsize ``image_bytes`` to at most ``max_side`` pixels on the longest
+    side and re-encode it as JPEG. Images that are already small enough
+    are returned unchanged.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    # Imported on first use, only image chat needs Pillow
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        if max(image.size) <= max_side and image.format in ("JPEG", "PNG"):
+            return image_bytes
+        # Phone photos are often stored sideways with an EXIF rotation
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=quality,
+                                  optimize=True)
+        return output.getvalue()
+
+
+class ImagePayloadCache:
+    """
+    In-memory LRU of base64 image payloads ready to be sent to a vision
+    model, keyed by content hash and target size, so asking about the same
+    image again skips decoding, resizing and encoding.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get_payload(self, image_bytes, model):
+        image_config = get_image_config()
+        max_side = get_target_size(model)
+        quality = image_config.get("jpeg_quality", 85)
+        key = (hashlib.sha256(image_bytes).hexdigest(), max_side, quality)
+        with self._lock:
+            if key in self._payloads:
+                self._payloads.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._payloads[key]
+            self.stats["misses"] += 1
+
+        with span("image.prepare", model=model,
+                  input_bytes=len(image_bytes)) as fields:
+            try:
+                prepared = resize_image(image_bytes, max_side, quality)
+            except OSError as e:  # Including UnidentifiedImageError
+                print(f"Sending the image as uploaded, preparing it "
+                      f"failed: {e}")
+                prepared = image_bytes
+            fields["output_bytes"] = len(prepared)
+            payload = convert_bytes_to_base64(prepared)
+
+        with self._lock:
+            self._payloads[key] = payload
+            while len(self._payloads) > self.max_entries:
+                self._payloads.popitem(last=False)
+        return payload
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._payloads)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_payload_cache = None
+_payload_cache_lock = threading.Lock()
+
+
+def get_image_payload_cache():
+    """Return the process-wide ``ImagePayloadCache``."""
+    global _payload_cache
+    with _payload_cache_lock:
+        if _payload_cache is None:
+            _payload_cache = ImagePayloadCache(
+                get_image_config().get("cache_max_entries", 32))
+        return _payload_cache
+
+
+def prepare_image(image_bytes, model):
+    """
+    Return the base64 payload of ``image_bytes`` downsized for ``model``.
+    """
+    return get_image_payload_cache().get_payload(image_bytes, model)
+
+
+def get_history_image(image_bytes):
+    """
+    Return the image to keep in the chat history. The history only shows
+    the image, so a thumbnail is stored instead of the full upload unless
+    ``image_processing.store_thumbnails`` is off.
+
+    Resizing runs on the caller's thread, before the message is queued,
+    so it does not hold up the shared database writer.
+    """
+    if not get_image_config().get("store_thumbnails", True):
+        return image_bytes
+    return make_thumbnail(image_bytes)
+
+
+def make_thumbnail(image_bytes):
+    """
+    Return the thumbnail kept in the chat history instead of the
+    original, or the original if it cannot be decoded.
+    """
+    image_config = get_image_config()
+    try:
+        return resize_image(image_bytes,
+                            image_config.get("thumbnail_max_side", 512),
+                            image_config.get("jpeg_quality", 85))
+    except OSError as e:
+        print(f"Storing the original image, thumbnailing failed: {e}")
+        return image_bytes
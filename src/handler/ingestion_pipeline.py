@@ -0,0 +1,120 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class EmbeddingPipeline:
+    """
+    Embed documents in fixed-size batches with a bounded number of
+    concurrent embedding requests, writing each batch to Chroma as soon as
+    it is embedded.
+
+    Chunks that are already stored are filtered out before embedding, so a
+    run that failed part-way resumes where it stopped: the batches that
+    completed are in Chroma and are skipped the next time.
+    """
+
+    def __init__(self, vector_db, collection, batch_size, max_concurrency,
+                 total_pages=None, progress_callback=None):
+        self.vector_db = vector_db
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.total_pages = total_pages
+        self.progress_callback = progress_callback
+        self.pages_seen = set()
+        self.embedded_chunks = 0
+        self.skipped_chunks = 0
+        self.failed_batches = []
+
+    def run(self, documents):
+        """
+        Embed and store ``documents``.
+
+        Args:
+            documents: An iterable of Documents with ids.
+
+        Returns:
+            dict: The chunk ids seen per document id.
+
+        Raises:
+            RuntimeError: If any batch failed. All other batches are
+                stored regardless.
+        """
+        chunk_ids = {}
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                thread_name_prefix="embed") as executor:
+            for batch in iter_batches(documents, self.batch_size):
+                for document in batch:
+                    chunk_ids.setdefault(
+                        document.metadata["document_id"],
+                        set()).add(document.id)
+                new_documents = self.filter_new(batch)
+                if not new_documents:
+                    self.report_progress(batch)
+                    continue
+                future = executor.submit(
+                    self.vector_db.embeddings.embed_documents,
+                    [document.page_content for document in new_documents])
+                in_flight[future] = (new_documents, batch)
+                if len(in_flight) >= self.max_concurrency:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self.store(done, in_flight)
+            self.store(wait(in_flight).done, in_flight)
+
+        if self.failed_batches:
+            raise RuntimeError(
+                f"{len(self.failed_batches)} embedding batches failed, "
+                f"{self.embedded_chunks} chunks were stored. Upload the "
+                f"files again to resume.")
+        return chunk_ids
+
+    def filter_new(self, batch):
+        unique_documents = list({doc.id: doc for doc in batch}.values())
+        existing_ids = set(self.vector_db.get(
+            ids=[doc.id for doc in unique_documents], include=[])["ids"])
+        self.skipped_chunks += len(existing_ids)
+        return [doc for doc in unique_documents if doc.id not in existing_ids]
+
+    def store(self, futures, in_flight):
+        # Runs on the calling thread, so Chroma writes and progress
+        # callbacks (which may touch Streamlit) stay off the worker pool
+        for future in futures:
+            documents, batch = in_flight.pop(future)
+            try:
+                embeddings = future.result()
+            except Exception as e:
+                print(f"Embedding batch failed: {e}")
+                self.failed_batches.append(documents)
+                continue
+            self.collection.upsert(
+                ids=[doc.id for doc in documents],
+                embeddings=embeddings,
+                documents=[doc.page_content for doc in documents],
+                metadatas=[doc.metadata for doc in documents])
+            self.embedded_chunks += len(documents)
+            self.report_progress(batch)
+
+    def report_progress(self, batch):
+        for document in batch:
+            self.pages_seen.add((document.metadata["document_id"],
+                                 document.metadata["page"]))
+        if self.progress_callback is None:
+            return
+        fraction = None
+        if self.total_pages:
+            fraction = min(1.0, len(self.pages_seen) / self.total_pages)
+        self.progress_callback(
+            fraction,
+            f"Embedded {self.embedded_chunks} chunks, skipped "
+            f"{self.skipped_chunks} already stored")
+
+
+def iter_batches(documents, batch_size):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
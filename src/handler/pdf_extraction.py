@@ -0,0 +1,30 @@
+import pypdfium2
+
+
+def count_pages(pdf_bytes):
+    pdf_file = pypdfium2.PdfDocument(pdf_bytes)
+    try:
+        return len(pdf_file)
+    finally:
+        pdf_file.close()
+
+
+def extract_page_range(pdf_path, start, end):
+    """
+    Extract the text of pages ``start`` to ``end`` (exclusive) of the pdf
+    at ``pdf_path``. pdfium reads only the parts of the file it needs.
+
+    Runs inside the extraction process pool, so this module only imports
+    pypdfium2 to keep worker start-up cheap.
+
+    Returns:
+        list: ``(page_number, text)`` tuples, in page order.
+    """
+    pdf_file = pypdfium2.PdfDocument(pdf_path)
+    try:
+        return [
+            (page_number,
+             pdf_file.get_page(page_number).get_textpage().get_text_range())
+            for page_number in range(start, end)]
+    finally:
+        pdf_file.close()
@@ -1,27 +1,115 @@
-import pypdfium2
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema.document import Document
-from pathlib import Path
-from src.database.vectordb_handler import load_vectordb
+from src.database.vectordb_handler import get_collection, load_vectordb
+from src.handler.ingestion_pipeline import EmbeddingPipeline
+from src.handler.pdf_extraction import count_pages, extract_page_range
+from src.llm.response_cache import get_response_cache
+from src.utils.metrics import span
 from src.utils.utils import timeit
 from src.utils import config_loader
 
-PROJECT_ROOT = Path(__file__).parent.parent
+config = config_loader.get_config()
 
-config = config_loader.load_config(f"{PROJECT_ROOT}/config/config.yaml")
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
 
 
-def get_pdf_texts(pdfs_bytes_list):
-    return [extract_text_from_pdf(pdf_bytes.getvalue())
-            for pdf_bytes in pdfs_bytes_list]
+def get_extraction_workers():
+    return config["pdf_ingestion"].get("workers") or os.cpu_count() or 1
 
 
-def extract_text_from_pdf(pdf_bytes):
-    pdf_file = pypdfium2.PdfDocument(pdf_bytes)
-    return "\n".join(
-        pdf_file.get_page(page_number).get_textpage().get_text_range()
-        for page_number in range(len(pdf_file)))
+def get_extraction_context():
+    """
+    Return the multiprocessing context of the extraction workers.
+
+    The app and the API server run many threads, so forking them could
+    copy a lock another thread holds into a worker, which then deadlocks.
+    Workers are started from a fork server instead (or spawned where there
+    is none), which only preloads ``pdf_extraction`` and so pypdfium2.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["src.handler.pdf_extraction"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def get_extraction_pool():
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            _extraction_pool = ProcessPoolExecutor(
+                max_workers=get_extraction_workers(),
+                mp_context=get_extraction_context())
+        return _extraction_pool
+
+
+def get_page_counts(pdfs_bytes_list):
+    return [count_pages(pdf_bytes.getvalue()) for pdf_bytes in pdfs_bytes_list]
+
+
+def iter_page_range_tasks(pdfs_bytes_list, page_counts, spool_dir):
+    """
+    Yield ``(index, path, start, end)`` page ranges of the pdfs, with the
+    index of the pdf in ``pdfs_bytes_list``. Every pdf is written to
+    ``spool_dir`` once and the workers open it by path, so its bytes are
+    not pickled to the pool again for each range.
+    """
+    pages_per_task = config["pdf_ingestion"]["pages_per_task"]
+    for index, (pdf_bytes, page_count) in enumerate(
+            zip(pdfs_bytes_list, page_counts)):
+        pdf_path = os.path.join(spool_dir, f"{index}.pdf")
+        with open(pdf_path, "wb") as pdf_file:
+            pdf_file.write(pdf_bytes.getvalue())
+        for start in range(0, page_count, pages_per_task):
+            yield (index, pdf_path, start,
+                   min(start + pages_per_task, page_count))
+
+
+def iter_pdf_pages(pdfs_bytes_list, page_counts=None):
+    """
+    Extract the uploaded pdfs page by page on the extraction process pool.
+    ``page_counts`` are the page counts of the pdfs, if already known.
+
+    Work is split across files and page ranges. Only a bounded number of
+    ranges is in flight at once, and pages are yielded in document order
+    as soon as their range is done, so chunking and embedding can start
+    before the last page has been extracted.
+
+    Yields:
+        tuple: ``(index, page_number, text)`` with the index of the pdf in
+        ``pdfs_bytes_list`` and 1-based page numbers.
+    """
+    if page_counts is None:
+        page_counts = get_page_counts(pdfs_bytes_list)
+    pool = get_extraction_pool()
+    max_in_flight = 2 * get_extraction_workers()
+    in_flight = deque()
+
+    with tempfile.TemporaryDirectory(prefix="pdf-extraction-") as spool_dir:
+        for index, pdf_path, start, end in iter_page_range_tasks(
+                pdfs_bytes_list, page_counts, spool_dir):
+            in_flight.append(
+                (index,
+                 pool.submit(extract_page_range, pdf_path, start, end)))
+            if len(in_flight) >= max_in_flight:
+                yield from iter_finished_pages(*in_flight.popleft())
+
+        while in_flight:
+            yield from iter_finished_pages(*in_flight.popleft())
+
+
+def iter_finished_pages(index, future):
+    for page_number, text in future.result():
+        yield index, page_number + 1, text
 
 
 def get_text_chunks(text):
@@ -32,18 +120,169 @@ def get_text_chunks(text):
     return splitter.split_text(text)
 
 
-def get_document_chunks(text_list):
-    documents = []
-    for text in text_list:
+def hash_content(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_document_id(source, file_hash):
+    # A file is identified by its name and its content, so files that
+    # share a name (in one upload or across uploads) are kept apart
+    return hash_content(f"{source}\0{file_hash}")
+
+
+def get_chunk_id(document_id, chunk_hash):
+    # Scoped by document so that identical text in other files stays
+    # attributed to those files
+    return hash_content(f"{document_id}\0{chunk_hash}")
+
+
+def get_document_chunks(pages, documents):
+    """
+    Chunk the ``(index, page_number, text)`` pages of ``documents``, a
+    list of ``(document_id, source)`` in the order of the pdfs.
+    """
+    for index, page_number, text in pages:
+        document_id, source = documents[index]
         for chunk in get_text_chunks(text):
-            documents.append(Document(page_content=chunk))
-    return documents
+            chunk_hash = hash_content(chunk)
+            yield Document(
+                id=get_chunk_id(document_id, chunk_hash),
+                page_content=chunk,
+                metadata={"source": source, "document_id": document_id,
+                          "page": page_number, "chunk_hash": chunk_hash})
+
+
+def is_document_ingested(vector_db, document_id, file_hash):
+    # file_hash is only set once all chunks of a document have been
+    # stored, see finalize_document
+    return bool(vector_db.get(
+        where={"$and": [{"document_id": document_id},
+                        {"file_hash": file_hash}]},
+        limit=1, include=[])["ids"])
+
+
+def finalize_document(vector_db, document_id, file_hash, chunk_ids):
+    """
+    Drop chunks of ``document_id`` that were not produced again (e.g.
+    after a change of the text splitter) and mark the current ones with
+    ``file_hash``.
+    """
+    stored = vector_db.get(where={"document_id": document_id},
+                           include=["metadatas"])
+    stale_ids = [chunk_id for chunk_id in stored["ids"]
+                 if chunk_id not in chunk_ids]
+    if stale_ids:
+        vector_db.delete(ids=stale_ids)
+
+    current = [(chunk_id, metadata) for chunk_id, metadata
+               in zip(stored["ids"], stored["metadatas"])
+               if chunk_id in chunk_ids]
+    if current:
+        get_collection().update(
+            ids=[chunk_id for chunk_id, _ in current],
+            metadatas=[{**metadata, "file_hash": file_hash}
+                       for _, metadata in current])
+
+
+def remove_other_versions(vector_db, source, file_hash, keep_document_ids,
+                          replace=False):
+    """
+    Delete chunks of other files named ``source``.
+
+    Chunks stored before documents had ids, with the same content, are
+    copies of the file just stored and always go. Files with the same name
+    and another content are only deleted when ``replace`` is set.
+    """
+    stored = vector_db.get(where={"source": source}, include=["metadatas"])
+    old_ids = []
+    for chunk_id, metadata in zip(stored["ids"], stored["metadatas"]):
+        document_id = metadata.get("document_id")
+        if document_id in keep_document_ids:
+            continue
+        if replace or (document_id is None and
+                       metadata.get("file_hash") == file_hash):
+            old_ids.append(chunk_id)
+    if old_ids:
+        vector_db.delete(ids=old_ids)
+        print(f"Removed {len(old_ids)} chunks of older versions of "
+              f"{source}.")
 
 
 @timeit
-def add_documents_to_db(pdfs_bytes):
-    texts = get_pdf_texts(pdfs_bytes)
-    documents = get_document_chunks(texts)
+def add_documents_to_db(pdfs_bytes, progress_callback=None, replace=False):
+    """
+    Extract, chunk, embed and store the uploaded pdfs.
+
+    Args:
+        pdfs_bytes (list): The uploaded pdf files.
+        progress_callback (callable, optional): Called with the fraction
+            of pages processed (or None if unknown) and a status message.
+        replace (bool): Delete the stored files that have the name of an
+            uploaded file but another content. By default they are kept
+            next to the uploaded ones.
+    """
     vector_db = load_vectordb()
-    vector_db.add_documents(documents)
+
+    # document_id -> (source, file_hash) of the files to store
+    documents = {}
+    new_pdfs = []
+    for pdf_bytes in pdfs_bytes:
+        file_hash = hash_content(pdf_bytes.getvalue())
+        document_id = get_document_id(pdf_bytes.name, file_hash)
+        if document_id in documents:
+            continue
+        documents[document_id] = (pdf_bytes.name, file_hash)
+        if is_document_ingested(vector_db, document_id, file_hash):
+            print(f"Skipping unchanged file {pdf_bytes.name}.")
+            continue
+        new_pdfs.append((document_id, pdf_bytes))
+
+    if not new_pdfs and not replace:
+        return
+
+    try:
+        if new_pdfs:
+            ingest_documents(vector_db, new_pdfs, documents,
+                             progress_callback)
+        for source, file_hash in documents.values():
+            remove_other_versions(vector_db, source, file_hash, documents,
+                                  replace=replace)
+    finally:
+        # Cached answers may cite the removed chunks, even if the
+        # ingestion failed halfway
+        get_response_cache().bump_collection_version()
     print("Documents added to db.")
+
+
+def ingest_documents(vector_db, new_pdfs, documents, progress_callback):
+    """Store the ``(document_id, pdf)`` pairs in ``new_pdfs``."""
+    pdfs = [pdf_bytes for _, pdf_bytes in new_pdfs]
+
+    # Each pdf is parsed once for its page count, which sizes both the
+    # extraction tasks and the progress bar
+    page_counts = get_page_counts(pdfs)
+    total_pages = sum(page_counts)
+    pipeline = EmbeddingPipeline(
+        vector_db,
+        get_collection(),
+        batch_size=config["pdf_ingestion"]["batch_size"],
+        max_concurrency=config["pdf_ingestion"]["embedding_concurrency"],
+        total_pages=total_pages,
+        progress_callback=progress_callback)
+    with span("pdf.ingestion", files=len(pdfs),
+              pages=total_pages) as fields:
+        try:
+            chunk_ids = pipeline.run(get_document_chunks(
+                iter_pdf_pages(pdfs, page_counts),
+                [(document_id, pdf_bytes.name)
+                 for document_id, pdf_bytes in new_pdfs]))
+        finally:
+            fields["embedded_chunks"] = pipeline.embedded_chunks
+            fields["skipped_chunks"] = pipeline.skipped_chunks
+
+    for document_id, _ in new_pdfs:
+        _, file_hash = documents[document_id]
+        finalize_document(vector_db, document_id, file_hash,
+                          chunk_ids.get(document_id, set()))
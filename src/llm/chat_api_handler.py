@@ -1,14 +1,30 @@
-import requests
-import streamlit as st
-
-from pathlib import Path
-from src.database.vectordb_handler import load_vectordb
+import functools
+import json
+import logging
+import time
+
+from src.handler.image_handler import prepare_image
+from src.llm.context_builder import ContextBuilder, get_token_budget
+from src.llm.model_residency import get_keep_alive, get_residency_manager
+from src.llm.ollama_client import get_ollama_client
+from src.llm.request_scheduler import (INTERACTIVE, SchedulerBusyError,
+                                       get_request_scheduler)
+from src.llm.response_cache import get_response_cache, normalize_question
 from src.utils import config_loader
-from src.utils.utils import convert_ns_to_seconds, convert_bytes_to_base64
+from src.utils.metrics import record_span, span
+from src.utils.utils import convert_ns_to_seconds
+
+config = config_loader.get_config()
 
-PROJECT_ROOT = Path(__file__).parent.parent
+logger = logging.getLogger(__name__)
 
-config = config_loader.load_config(f"{PROJECT_ROOT}/config/config.yaml")
+
+def get_error_message(response):
+    """Return the error of a failed Ollama response."""
+    try:
+        return response.json()["error"]
+    except (ValueError, KeyError, TypeError):
+        return f"HTTP {response.status_code}: {response.text}"
 
 
 class OllamaChatAPIHandler:
@@ -17,31 +33,100 @@ class OllamaChatAPIHandler:
         pass
 
     @classmethod
-    def api_call(cls, chat_history):
+    def api_call(cls, chat_history, model):
         data = {
-            "model": st.session_state["model_to_use"],
+            "model": model,
             "messages": chat_history,
-            "stream": False
+            "stream": False,
+            "keep_alive": get_keep_alive(),
+            # Ollama truncates to its own default context size otherwise,
+            # whatever the context builder packed
+            "options": {"num_ctx": get_token_budget(model)},
         }
-        response = requests.post(
-            url=config["ollama"]["base_url"] + "/api/chat",
-            json=data)
-        print(response.json())
+        try:
+            with get_request_scheduler().slot(model, INTERACTIVE):
+                response = get_ollama_client().post("/api/chat", json=data)
+        except SchedulerBusyError as e:
+            return "OLLAMA ERROR: " + str(e)
+        if response.status_code != 200:
+            return "OLLAMA ERROR: " + get_error_message(response)
         json_response = response.json()
+        logger.debug("Ollama response: %s", json_response)
         if "error" in json_response.keys():
             return "OLLAMA ERROR: " + json_response["error"]
-        cls.print_times(json_response)
+        cls.record_times(json_response)
         return json_response["message"]["content"]
 
     @classmethod
-    def image_chat(cls, user_input, chat_history, image):
+    def stream_api_call(cls, chat_history, model):
+        """
+        Stream the answer for ``chat_history`` from Ollama.
+
+        Ollama answers with one JSON object per line; the content of each
+        chunk is yielded as soon as it arrives. The final chunk carries the
+        timing statistics, which are recorded together with the
+        time-to-first-token measured here.
+
+        Yields:
+            str: The next piece of the assistant's answer.
+        """
+        data = {
+            "model": model,
+            "messages": chat_history,
+            "stream": True,
+            "keep_alive": get_keep_alive(),
+            "options": {"num_ctx": get_token_budget(model)},
+        }
+        start_time = time.perf_counter()
+        first_token_time = None
+        scheduler = get_request_scheduler()
+        try:
+            scheduler.acquire(model, INTERACTIVE)
+        except SchedulerBusyError as e:
+            yield "OLLAMA ERROR: " + str(e)
+            return
+        try:
+            with get_ollama_client().post("/api/chat", json=data,
+                                          stream=True) as response:
+                if response.status_code != 200:
+                    yield "OLLAMA ERROR: " + get_error_message(response)
+                    return
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    json_chunk = json.loads(line)
+                    if "error" in json_chunk.keys():
+                        yield "OLLAMA ERROR: " + json_chunk["error"]
+                        return
+                    content = json_chunk.get("message", {}).get("content",
+                                                                "")
+                    if content:
+                        if first_token_time is None:
+                            first_token_time = time.perf_counter()
+                        yield content
+                    if json_chunk.get("done", False):
+                        time_to_first_token = (
+                            first_token_time - start_time
+                            if first_token_time is not None else None)
+                        cls.record_times(json_chunk, time_to_first_token)
+        finally:
+            # Held until the stream is consumed or closed
+            scheduler.release(model)
+
+    @classmethod
+    def image_chat(cls, user_input, chat_history, image, model,
+                   stream=False):
         chat_history.append(
             {"role": "user", "content": user_input,
-             "images": [convert_bytes_to_base64(image)]})
-        return cls.api_call(chat_history)
+             "images": [prepare_image(image, model)]})
+        if stream:
+            return cls.stream_api_call(chat_history, model)
+        return cls.api_call(chat_history, model)
 
     @classmethod
-    def print_times(cls, json_response):        
+    def record_times(cls, json_response, time_to_first_token=None):
+        get_residency_manager().record_response(json_response.get("model"),
+                                                json_response)
         total_duration_ns = json_response.get("total_duration", 0)
         load_duration_ns = json_response.get("load_duration", 0)
         prompt_eval_duration_ns = json_response.get("prompt_eval_duration", 0)
@@ -53,11 +138,16 @@ class OllamaChatAPIHandler:
             prompt_eval_duration_ns)
         eval_duration_seconds = convert_ns_to_seconds(eval_duration_ns)
 
-        print(f"Total duration: {total_duration_seconds:.4f} seconds")
-        print(f"Load duration: {load_duration_seconds:.4f} seconds")
-        print(f"Prompt eval duration: {prompt_eval_duration_seconds:.4f} \
-              seconds")
-        print(f"Eval duration: {eval_duration_seconds:.4f} seconds")
+        eval_count = json_response.get("eval_count", 0)
+        record_span(
+            "llm.chat", total_duration_seconds,
+            model=json_response.get("model"),
+            prompt_tokens=json_response.get("prompt_eval_count"),
+            eval_tokens=eval_count,
+            eval_duration_s=eval_duration_seconds,
+            load_s=load_duration_seconds,
+            prompt_eval_s=prompt_eval_duration_seconds,
+            time_to_first_token_s=time_to_first_token)
 
 
 class ChatAPIHandler:
@@ -66,31 +156,95 @@ class ChatAPIHandler:
         pass
 
     @classmethod
-    def chat(cls, user_input, chat_history, image=None):
-        endpoint = st.session_state["endpoint_to_use"]
-        print(f"Endpoint to use: {endpoint}")
-        print(f"Model to use: {st.session_state['model_to_use']}")
+    def chat(cls, user_input, chat_history, model, endpoint="ollama",
+             pdf_chat=False, image=None, stream=False):
+        """
+        Answer ``user_input`` given the previous ``chat_history``.
+
+        Args:
+            user_input (str): The user's message.
+            chat_history (list): Earlier messages as role/content dicts.
+            model (str): The model to answer with.
+            endpoint (str): The API serving ``model``.
+            pdf_chat (bool): Answer from the documents in the vector store.
+            image (bytes, optional): An image to ask about.
+            stream (bool): Return a generator of answer chunks instead of
+                the complete answer.
+        """
+        logger.debug("Answering with %s on %s", model, endpoint)
         if endpoint == "ollama":
             handler = OllamaChatAPIHandler
         else:
             raise ValueError(f"Unknown endpoint: {endpoint}")
 
-        if st.session_state.get("pdf_chat", False):
+        context_builder = ContextBuilder(model)
+
+        if pdf_chat:
+            # Chroma and langchain take seconds to import, only PDF chat
+            # needs them
+            from src.database.vectordb_handler import load_vectordb
+
+            start_time = time.perf_counter()
             vector_db = load_vectordb()
-            retrieved_documents = vector_db.similarity_search(
-                user_input,
-                k=config["chat_config"]["number_of_retrieved_documents"]
-                )
-            context = "\n".join(
-                [item.page_content for item in retrieved_documents]
-                )
-            template = f"Answer the user question based on this context: \
-                {context}\nUser Question: {user_input}"
-            chat_history.append({"role": "user", "content": template})
-            return handler.api_call(chat_history)
+            # One embedding serves the cache lookup and the retrieval
+            question_vector = vector_db.embeddings.embed_query(
+                normalize_question(user_input))
+            response_cache = get_response_cache()
+            collection_version = response_cache.get_collection_version()
+            cached_answer = response_cache.lookup(model, collection_version,
+                                                  question_vector)
+            if cached_answer is not None:
+                logger.debug("Answered from the response cache.")
+                return iter([cached_answer]) if stream else cached_answer
+
+            with span("retrieval"):
+                search = (vector_db.
+                          similarity_search_by_vector_with_relevance_scores)
+                retrieved_documents = search(
+                    question_vector,
+                    k=config["chat_config"]["number_of_retrieved_documents"])
+            context = context_builder.build(user_input, chat_history,
+                                            retrieved_documents)
+            logger.debug("Context tokens: %s", context["report"])
+            chat_history = context["history"]
+            chat_history.append({"role": "user",
+                                 "content": context["prompt"]})
+            answer = cls.call(handler, chat_history, model, stream)
+            cache_answer = functools.partial(
+                response_cache.put, model, collection_version,
+                question_vector, user_input)
+            if stream:
+                return cls.cache_when_consumed(answer, cache_answer,
+                                               start_time)
+            cls.cache(answer, cache_answer, start_time)
+            return answer
+
+        context = context_builder.build(user_input, chat_history)
+        logger.debug("Context tokens: %s", context["report"])
+        chat_history = context["history"]
 
         if image:
-            return handler.image_chat(user_input, chat_history, image)
+            return handler.image_chat(user_input, chat_history, image,
+                                      model, stream=stream)
 
         chat_history.append({"role": "user", "content": user_input})
-        return handler.api_call(chat_history)
+        return cls.call(handler, chat_history, model, stream)
+
+    @classmethod
+    def cache(cls, answer, cache_answer, start_time):
+        if not answer.startswith("OLLAMA ERROR: "):
+            cache_answer(answer, time.perf_counter() - start_time)
+
+    @classmethod
+    def cache_when_consumed(cls, chunks, cache_answer, start_time):
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        cls.cache("".join(parts), cache_answer, start_time)
+
+    @classmethod
+    def call(cls, handler, chat_history, model, stream):
+        if stream:
+            return handler.stream_api_call(chat_history, model)
+        return handler.api_call(chat_history, model)
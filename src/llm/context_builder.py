@@ -0,0 +1,150 @@
+import math
+
+from src.utils import config_loader
+
+config = config_loader.get_config()
+
+PDF_PROMPT_TEMPLATE = (
+    "Answer the user question based on this context: {context}\n"
+    "User Question: {user_input}")
+
+
+def estimate_tokens(text):
+    """
+    Estimate the token count of ``text`` without a model tokenizer.
+    """
+    chars_per_token = config["context_budget"].get("chars_per_token", 4)
+    return math.ceil(len(text or "") / chars_per_token)
+
+
+def get_token_budget(model):
+    """
+    Return the prompt token budget for ``model``: the longest matching
+    prefix in ``context_budget.models``, else the default.
+    """
+    budget_config = config["context_budget"]
+    matches = [prefix for prefix in budget_config.get("models", {})
+               if model and model.startswith(prefix)]
+    if matches:
+        return budget_config["models"][max(matches, key=len)]
+    return budget_config["default"]
+
+
+def get_shingles(text, size=5):
+    words = text.lower().split()
+    return {tuple(words[i:i + size])
+            for i in range(max(1, len(words) - size + 1))}
+
+
+def overlap_ratio(shingles, other_shingles):
+    if not shingles or not other_shingles:
+        return 0.0
+    return (len(shingles & other_shingles) /
+            min(len(shingles), len(other_shingles)))
+
+
+class ContextBuilder:
+    """
+    Assemble the prompt for a chat turn within a per-model token budget.
+
+    The question is always included. Retrieved chunks are added next, best
+    score first and skipping chunks that mostly overlap one already taken,
+    up to ``retrieval_share`` of the budget. The remaining budget is filled
+    with the summary of the earlier conversation, if any, and then with
+    chat history, newest message first.
+    """
+
+    def __init__(self, model):
+        budget_config = config["context_budget"]
+        self.model = model
+        self.budget = get_token_budget(model)
+        self.reserve_for_answer = budget_config.get("reserve_for_answer", 0)
+        self.retrieval_share = budget_config.get("retrieval_share", 0.6)
+        self.max_chunk_overlap = budget_config.get("max_chunk_overlap", 0.8)
+
+    def build(self, user_input, chat_history, retrieved_documents=None):
+        """
+        Args:
+            user_input (str): The user's question.
+            chat_history (list): Earlier messages, oldest first.
+            retrieved_documents (list, optional): ``(Document, distance)``
+                pairs from ``similarity_search_with_score``. When given, the
+                question is wrapped in ``PDF_PROMPT_TEMPLATE``.
+
+        Returns:
+            dict: ``history`` (the messages that fit), ``prompt`` (the final
+            user message content) and ``report`` (tokens used per part).
+        """
+        available = max(0, self.budget - self.reserve_for_answer)
+        report = {"model": self.model, "budget": self.budget}
+
+        if retrieved_documents is None:
+            prompt = user_input
+            report["context_tokens"] = 0
+        else:
+            base_tokens = estimate_tokens(
+                PDF_PROMPT_TEMPLATE.format(context="", user_input=user_input))
+            chunks, duplicates = self.select_chunks(
+                retrieved_documents,
+                int(max(0, available - base_tokens) * self.retrieval_share))
+            prompt = PDF_PROMPT_TEMPLATE.format(
+                context="\n".join(chunks), user_input=user_input)
+            report["context_tokens"] = estimate_tokens("\n".join(chunks))
+            report["chunks_used"] = len(chunks)
+            report["chunks_dropped_duplicate"] = duplicates
+            report["chunks_dropped_budget"] = (
+                len(retrieved_documents) - len(chunks) - duplicates)
+
+        report["question_tokens"] = (estimate_tokens(prompt) -
+                                     report["context_tokens"])
+        history = self.select_history(
+            chat_history, available - estimate_tokens(prompt))
+        report["history_tokens"] = sum(
+            estimate_tokens(message["content"]) for message in history)
+        report["history_messages_used"] = len(history)
+        report["history_messages_dropped"] = len(chat_history) - len(history)
+        report["total_tokens"] = (report["question_tokens"] +
+                                  report["context_tokens"] +
+                                  report["history_tokens"])
+        return {"history": history, "prompt": prompt, "report": report}
+
+    def select_chunks(self, retrieved_documents, token_budget):
+        selected = []
+        selected_shingles = []
+        duplicates = 0
+        used_tokens = 0
+        for document, _ in sorted(retrieved_documents,
+                                  key=lambda item: item[1]):
+            shingles = get_shingles(document.page_content)
+            if any(overlap_ratio(shingles, other) >= self.max_chunk_overlap
+                   for other in selected_shingles):
+                duplicates += 1
+                continue
+            tokens = estimate_tokens(document.page_content)
+            if used_tokens + tokens > token_budget:
+                continue
+            selected.append(document.page_content)
+            selected_shingles.append(shingles)
+            used_tokens += tokens
+        return selected, duplicates
+
+    def select_history(self, chat_history, token_budget):
+        # A leading system message summarizes everything older than the
+        # recent messages, so it goes in before them
+        pinned = [message for message in chat_history[:1]
+                  if message["role"] == "system"]
+        used_tokens = sum(estimate_tokens(message["content"])
+                          for message in pinned)
+        if used_tokens > token_budget:
+            pinned = []
+            used_tokens = 0
+
+        history = []
+        for message in reversed(chat_history[len(pinned):]):
+            tokens = estimate_tokens(message["content"])
+            if used_tokens + tokens > token_budget:
+                break
+            history.append(message)
+            used_tokens += tokens
+        history.reverse()
+        return pinned + history
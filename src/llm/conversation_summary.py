@@ -0,0 +1,173 @@
+import threading
+
+from src.database.db_operations import (
+    load_last_k_text_messages_ollama, load_summary, load_text_messages_after,
+    save_summary, wait_for_pending_writes)
+from src.llm.context_builder import get_token_budget
+from src.llm.model_residency import get_keep_alive
+from src.llm.ollama_client import get_ollama_client
+from src.llm.request_scheduler import BACKGROUND, get_request_scheduler
+from src.utils import config_loader
+from src.utils.metrics import span
+
+config = config_loader.get_config()
+
+SUMMARY_PROMPT = """
+Update the summary of a conversation between a user and an assistant
+with the new messages below. Keep the facts, names, numbers, decisions
+and open questions that later answers may need, drop small talk, and
+answer with the updated summary only.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+"""
+
+
+def load_chat_memory(chat_history_id, k):
+    """
+    Load the history for the next turn of a session: the summary of the
+    older messages, as a leading system message, followed by the text
+    messages that are not part of it yet.
+
+    That is up to ``k`` messages while the summarizer keeps up. When it
+    falls behind, every unsummarized message (up to
+    ``max_unsummarized_messages``) is loaded, so the messages between the
+    summary and the last ``k`` are not silently left out; the context
+    builder trims them to the model's token budget. Without summaries the
+    history is the last ``k`` messages.
+    """
+    summary_config = config.get("conversation_summary", {})
+    limit = k
+    if summary_config.get("enabled", True):
+        limit = max(k, summary_config.get("max_unsummarized_messages", 200))
+    summary, summarized_until = load_summary(chat_history_id)
+    history = load_last_k_text_messages_ollama(
+        chat_history_id, limit, after_message_id=summarized_until)
+    if len(history) > k + 2:
+        # More than the turn the summarizer may not have seen yet
+        print(f"The summary of {chat_history_id} is behind, sending "
+              f"{len(history)} unsummarized messages.")
+    if summary:
+        history.insert(0, {"role": "system",
+                           "content": "Summary of the earlier conversation:"
+                                      f"\n{summary}"})
+    return history
+
+
+class ConversationSummarizer:
+    """
+    Folds older messages of a session into its running summary.
+
+    After each turn the session is queued for a background thread. Once
+    more than ``chat_memory_length`` messages are not covered by the
+    summary, all but the newest ``keep_recent`` of them are summarized
+    together with the current summary, so the history sent per turn stays
+    at about ``keep_recent`` to ``chat_memory_length`` messages plus one
+    summary, however long the session gets.
+    """
+
+    def __init__(self, summary_config=None):
+        summary_config = (summary_config or
+                          config.get("conversation_summary", {}))
+        self.trigger = config["chat_config"]["chat_memory_length"]
+        self.keep_recent = min(summary_config.get("keep_recent", 10),
+                               self.trigger)
+        self.max_messages_per_update = summary_config.get(
+            "max_messages_per_update", 40)
+        self.model = summary_config.get("model")
+        self.max_summary_tokens = summary_config.get("max_summary_tokens",
+                                                     400)
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._worker = None
+
+    def schedule(self, chat_history_id, model):
+        """
+        Queue ``chat_history_id`` for a summary update, done with the
+        configured model or else ``model``.
+        """
+        with self._condition:
+            self._pending[chat_history_id] = self.model or model
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="conversation-summarizer",
+                    daemon=True)
+                self._worker.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                chat_history_id = next(iter(self._pending))
+                model = self._pending.pop(chat_history_id)
+            try:
+                self.update(chat_history_id, model)
+            except Exception as e:
+                print(f"Summarizing {chat_history_id} failed: {e}")
+
+    def update(self, chat_history_id, model):
+        while True:
+            summary, summarized_until = load_summary(chat_history_id)
+            messages = load_text_messages_after(
+                chat_history_id, summarized_until,
+                self.max_messages_per_update + self.trigger)
+            if len(messages) <= self.trigger:
+                return
+            fold = messages[:min(self.max_messages_per_update,
+                                 len(messages) - self.keep_recent)]
+            summary = self.summarize(model, summary, fold)
+            if summary is None:
+                return
+            save_summary(chat_history_id, summary, fold[-1]["message_id"])
+            wait_for_pending_writes(chat_history_id)
+            print(f"Summarized {len(fold)} messages of {chat_history_id}.")
+
+    def summarize(self, model, summary, messages):
+        prompt = SUMMARY_PROMPT.format(
+            summary=summary or "(none yet)",
+            messages="\n".join(f"{message['role']}: {message['content']}"
+                               for message in messages))
+        data = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": False,
+            "keep_alive": get_keep_alive(),
+            "options": {"num_ctx": get_token_budget(model),
+                        "num_predict": self.max_summary_tokens},
+        }
+        with get_request_scheduler().slot(model, BACKGROUND):
+            with span("summary.update", model=model,
+                      messages=len(messages)) as fields:
+                json_response = get_ollama_client().post(
+                    "/api/chat", json=data).json()
+                fields["prompt_tokens"] = json_response.get(
+                    "prompt_eval_count")
+                fields["eval_tokens"] = json_response.get("eval_count")
+        if "error" in json_response:
+            print(f"OLLAMA ERROR: {json_response['error']}")
+            return None
+        return json_response["message"]["content"].strip() or None
+
+
+_summarizer = None
+_summarizer_lock = threading.Lock()
+
+
+def get_summarizer():
+    """Return the process-wide ``ConversationSummarizer``."""
+    global _summarizer
+    with _summarizer_lock:
+        if _summarizer is None:
+            _summarizer = ConversationSummarizer()
+        return _summarizer
+
+
+def schedule_summary(chat_history_id, model):
+    """Queue a summary update if summaries are enabled in the config."""
+    if config.get("conversation_summary", {}).get("enabled", True):
+        get_summarizer().schedule(chat_history_id, model)
@@ -0,0 +1,174 @@
+import threading
+import time
+
+from src.llm.context_builder import get_token_budget
+from src.llm.ollama_client import get_ollama_client, normalize_model_name
+from src.llm.request_scheduler import BACKGROUND, get_request_scheduler
+from src.utils import config_loader
+
+config = config_loader.get_config()
+
+
+def get_keep_alive():
+    """Return the ``keep_alive`` to send with every Ollama request."""
+    return config["ollama"].get("keep_alive", "30m")
+
+
+class ModelResidencyManager:
+    """
+    Keeps the models we need loaded in Ollama.
+
+    Models are preloaded in the background (e.g. when the model selectbox
+    changes), and a warm set of chat, embedding and vision models is kept
+    resident within ``residency.memory_budget_gb``, unloading the least
+    recently used models first. Every response is checked for a cold load
+    so the cold-hit rate per model can be reported.
+    """
+
+    def __init__(self):
+        residency_config = config.get("residency", {})
+        self.memory_budget_bytes = int(
+            residency_config.get("memory_budget_gb", 0) * 1024 ** 3)
+        self.cold_load_threshold_ns = int(
+            residency_config.get("cold_load_threshold_ms", 500) * 1e6)
+        self.embedding_models = {
+            normalize_model_name(config["ollama"]["embedding_model"])}
+        self.warm_models = list(residency_config.get("warm_models", []))
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._preloading = set()
+        self._stats = {}
+        self._warmed_up = False
+
+    def preload(self, model, background=True):
+        """
+        Load ``model`` into Ollama so the first real request is warm.
+        """
+        if not model:
+            return
+        model = normalize_model_name(model)
+        with self._lock:
+            if model in self._preloading:
+                return
+            self._preloading.add(model)
+            self._last_used[model] = time.monotonic()
+        if background:
+            threading.Thread(target=self._preload, args=(model,),
+                             daemon=True).start()
+        else:
+            self._preload(model)
+
+    def _preload(self, model):
+        try:
+            with get_request_scheduler().slot(model, BACKGROUND):
+                self._send(model, get_keep_alive())
+            print(f"Preloaded model {model}.")
+            self.enforce_memory_budget(protected={model})
+        except Exception as e:
+            print(f"Preloading {model} failed: {e}")
+        finally:
+            with self._lock:
+                self._preloading.discard(model)
+
+    def unload(self, model):
+        self._send(model, 0)
+        print(f"Unloaded model {model}.")
+
+    def _send(self, model, keep_alive):
+        # An empty request loads (or with keep_alive 0, unloads) a model
+        # without generating anything
+        if model in self.embedding_models:
+            get_ollama_client().post(
+                "/api/embed", json={"model": model, "input": ["warm-up"],
+                                    "keep_alive": keep_alive})
+        else:
+            # With the num_ctx of the chat requests, which would reload
+            # the model otherwise
+            get_ollama_client().post(
+                "/api/chat", json={
+                    "model": model, "messages": [],
+                    "keep_alive": keep_alive,
+                    "options": {"num_ctx": get_token_budget(model)}})
+
+    def warm_up(self, selected_model=None):
+        """
+        Preload the configured warm set once per process.
+        """
+        with self._lock:
+            if self._warmed_up:
+                return
+            self._warmed_up = True
+        for model in (self.warm_models + list(self.embedding_models) +
+                      [selected_model]):
+            if model:
+                self.preload(model)
+
+    def list_loaded_models(self):
+        """
+        Return ``{model: size_in_bytes}`` of the models Ollama has loaded.
+        """
+        json_response = get_ollama_client().get("/api/ps").json()
+        return {normalize_model_name(model["name"]): model.get("size", 0)
+                for model in json_response.get("models", [])}
+
+    def enforce_memory_budget(self, protected=()):
+        """
+        Unload least recently used models until the loaded models fit in
+        the memory budget. ``protected`` models and the embedding model
+        are never unloaded.
+        """
+        if not self.memory_budget_bytes:
+            return
+        loaded = self.list_loaded_models()
+        total = sum(loaded.values())
+        protected = ({normalize_model_name(model) for model in protected} |
+                     self.embedding_models)
+        with self._lock:
+            candidates = sorted(
+                (model for model in loaded if model not in protected),
+                key=lambda model: self._last_used.get(model, 0))
+        for model in candidates:
+            if total <= self.memory_budget_bytes:
+                break
+            self.unload(model)
+            total -= loaded[model]
+
+    def record_response(self, model, json_response):
+        """
+        Count a request to ``model`` and whether it hit a cold model,
+        based on the ``load_duration`` Ollama reports.
+        """
+        if not model:
+            return
+        model = normalize_model_name(model)
+        cold = (json_response.get("load_duration", 0) >
+                self.cold_load_threshold_ns)
+        with self._lock:
+            self._last_used[model] = time.monotonic()
+            stats = self._stats.setdefault(
+                model, {"requests": 0, "cold_requests": 0})
+            stats["requests"] += 1
+            stats["cold_requests"] += int(cold)
+        if cold:
+            print(f"Model {model} was cold, loaded in "
+                  f"{json_response['load_duration'] / 1e9:.2f} seconds.")
+
+    def get_stats(self):
+        with self._lock:
+            return {model: {**stats,
+                            "cold_rate": (stats["cold_requests"] /
+                                          stats["requests"])}
+                    for model, stats in self._stats.items()}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_residency_manager():
+    """Return the process-wide ``ModelResidencyManager``."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ModelResidencyManager()
+        return _manager
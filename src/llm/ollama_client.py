@@ -0,0 +1,216 @@
+import asyncio
+import requests
+import threading
+
+from requests.adapters import HTTPAdapter
+from src.utils import config_loader
+from urllib3.util.retry import Retry
+
+config = config_loader.get_config()
+
+IDEMPOTENT_METHODS = Retry.DEFAULT_ALLOWED_METHODS
+
+DEFAULT_TIMEOUTS = {
+    "chat": 300,
+    "embed": 60,
+    "tags": 10,
+    "ps": 10,
+    "pull": 1800,
+    "default": 60,
+}
+
+ENDPOINT_NAMES = {
+    "/api/chat": "chat",
+    "/api/embed": "embed",
+    "/api/tags": "tags",
+    "/api/ps": "ps",
+    "/api/pull": "pull",
+}
+
+
+def get_client_config():
+    client_config = config["ollama"].get("client", {})
+    return {
+        "base_url": config["ollama"]["base_url"],
+        "timeouts": {**DEFAULT_TIMEOUTS,
+                     **client_config.get("timeouts", {})},
+        "pool_size": client_config.get("pool_size", 10),
+        "retries": client_config.get("retries", 3),
+        "backoff_factor": client_config.get("backoff_factor", 0.5),
+        "keepalive_s": client_config.get("keepalive_s", 30),
+    }
+
+
+def normalize_model_name(model):
+    # Ollama reports "nomic-embed-text" as "nomic-embed-text:latest"
+    return model if ":" in model else f"{model}:latest"
+
+
+def get_timeout(timeouts, path):
+    return timeouts.get(ENDPOINT_NAMES.get(path), timeouts["default"])
+
+
+class OllamaClient:
+    """
+    Pooled, keep-alive HTTP client for the Ollama API.
+
+    All requests share one ``requests.Session`` whose connection pool is
+    reused across threads. Failed connection attempts are retried with
+    exponential backoff, 502/503/504 answers only for idempotent methods:
+    a POST to /api/chat may already be generating. Every endpoint gets its
+    own timeout from the ``ollama.client.timeouts`` config.
+    """
+
+    def __init__(self, base_url, timeouts, pool_size, retries,
+                 backoff_factor, **kwargs):
+        self.base_url = base_url.rstrip("/")
+        self.timeouts = timeouts
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            # Connect errors are retried for every method, as nothing was
+            # sent yet
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", get_timeout(self.timeouts, path))
+        return self.session.request(method, self.base_url + path, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, json=None, **kwargs):
+        return self.request("POST", path, json=json, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncOllamaClient:
+    """
+    Async counterpart of ``OllamaClient`` built on one shared
+    ``aiohttp.ClientSession`` per event loop.
+    """
+
+    def __init__(self, base_url, timeouts, pool_size, retries,
+                 backoff_factor, keepalive_s, **kwargs):
+        self.base_url = base_url.rstrip("/")
+        self.timeouts = timeouts
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.keepalive_s = keepalive_s
+        self._session = None
+
+    def _get_session(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size, keepalive_timeout=self.keepalive_s)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def request(self, method, path, **kwargs):
+        """
+        Send a request with the retry policy of ``OllamaClient``: failed
+        connection attempts are retried with exponential backoff, timeouts,
+        dropped connections and 502/503/504 answers only for idempotent
+        methods. The caller owns the returned response and must release it
+        (``async with`` or ``release()``).
+        """
+        import aiohttp
+
+        kwargs.setdefault("timeout", aiohttp.ClientTimeout(
+            total=get_timeout(self.timeouts, path)))
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self._get_session().request(
+                    method, self.base_url + path, **kwargs)
+                if (response.status in (502, 503, 504) and idempotent and
+                        attempt < self.retries):
+                    response.release()
+                else:
+                    return response
+            except aiohttp.ClientConnectorError:
+                if attempt >= self.retries:
+                    raise
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if not idempotent or attempt >= self.retries:
+                    raise
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, json=None, **kwargs):
+        return await self.request("POST", path, json=json, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_client = None
+_async_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_ollama_client():
+    """Return the process-wide ``OllamaClient``."""
+    global _client
+    with _clients_lock:
+        if _client is None:
+            _client = OllamaClient(**get_client_config())
+        return _client
+
+
+def get_async_ollama_client():
+    """
+    Return the ``AsyncOllamaClient`` of the running event loop.
+
+    aiohttp sessions are bound to the loop they were created on, so one
+    client is kept per loop.
+    """
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        for other_loop in [other_loop for other_loop in _async_clients
+                           if other_loop.is_closed()]:
+            del _async_clients[other_loop]
+        if loop not in _async_clients:
+            _async_clients[loop] = AsyncOllamaClient(**get_client_config())
+        return _async_clients[loop]
+
+
+async def close_async_ollama_client():
+    """Close the client of the running event loop, if any."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.close()
+
+
+def reset_ollama_clients():
+    """
+    Drop the shared sync client so that the next call picks up config
+    changes, e.g. a different ``base_url``.
+    """
+    global _client
+    with _clients_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
@@ -0,0 +1,191 @@
+import heapq
+import itertools
+import threading
+import time
+
+from contextlib import contextmanager
+from src.llm.ollama_client import normalize_model_name
+from src.utils import config_loader
+from src.utils.metrics import record_span
+
+config = config_loader.get_config()
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class SchedulerBusyError(RuntimeError):
+    """Raised when a request cannot be queued or waited too long."""
+
+
+class RequestScheduler:
+    """
+    Admission control for the requests that make Ollama run a model.
+
+    A request holds a slot for its whole duration (for a streamed answer
+    until the stream is consumed). Slots are limited per model and for all
+    models together, and ``reserved_interactive`` of the global slots are
+    kept free for interactive requests. Waiting requests are admitted in
+    priority order, so chat and query embeddings overtake queued ingestion
+    batches. Each priority has a bounded queue; a full queue blocks the
+    caller until there is room, which pushes back on bulk producers, and
+    a request that cannot get a slot within ``queue_timeout_s`` fails
+    with ``SchedulerBusyError``.
+    """
+
+    def __init__(self, scheduler_config=None):
+        scheduler_config = scheduler_config or config.get("scheduler", {})
+        self.max_concurrency = scheduler_config.get("max_concurrency", 4)
+        self.max_concurrency_per_model = scheduler_config.get(
+            "max_concurrency_per_model", 2)
+        self.model_limits = scheduler_config.get("models", {})
+        self.reserved_interactive = min(
+            scheduler_config.get("reserved_interactive", 1),
+            self.max_concurrency - 1)
+        self.max_queue_size = scheduler_config.get("max_queue_size", 64)
+        self.queue_timeout_s = scheduler_config.get("queue_timeout_s", 120)
+
+        self._condition = threading.Condition()
+        self._tickets = itertools.count()
+        self._waiting = []
+        self._queued = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._active = {}
+        self._total_active = 0
+        self._stats = {priority: {"admitted": 0, "rejected": 0}
+                       for priority in PRIORITY_NAMES}
+
+    def get_model_limit(self, model):
+        # Longest matching prefix, so "llama3" covers "llama3:8b"
+        matches = [prefix for prefix in self.model_limits
+                   if model.startswith(prefix)]
+        if matches:
+            return self.model_limits[max(matches, key=len)]
+        return self.max_concurrency_per_model
+
+    @contextmanager
+    def slot(self, model, priority=INTERACTIVE):
+        """
+        Hold a slot for ``model`` while the enclosed block runs.
+
+        Raises:
+            SchedulerBusyError: If no slot was free within
+                ``queue_timeout_s``.
+        """
+        self.acquire(model, priority)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    def acquire(self, model, priority=INTERACTIVE):
+        model = normalize_model_name(model)
+        start_time = time.perf_counter()
+        deadline = time.monotonic() + self.queue_timeout_s
+        with self._condition:
+            # Backpressure: wait for room in the queue of this priority
+            while self._queued[priority] >= self.max_queue_size:
+                if not self._wait(deadline):
+                    self._stats[priority]["rejected"] += 1
+                    raise SchedulerBusyError(
+                        f"Too many queued {PRIORITY_NAMES[priority]} "
+                        f"requests for Ollama.")
+
+            ticket = (priority, next(self._tickets), model)
+            heapq.heappush(self._waiting, ticket)
+            self._queued[priority] += 1
+            try:
+                while not self._can_run(ticket):
+                    if not self._wait(deadline):
+                        self._stats[priority]["rejected"] += 1
+                        raise SchedulerBusyError(
+                            f"No Ollama slot for {model} within "
+                            f"{self.queue_timeout_s} seconds.")
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._queued[priority] -= 1
+                self._condition.notify_all()
+
+            self._active[model] = self._active.get(model, 0) + 1
+            self._total_active += 1
+            self._stats[priority]["admitted"] += 1
+
+        record_span("scheduler.queue_wait", time.perf_counter() - start_time,
+                    model=model, priority=PRIORITY_NAMES[priority])
+
+    def release(self, model):
+        model = normalize_model_name(model)
+        with self._condition:
+            self._active[model] -= 1
+            self._total_active -= 1
+            self._condition.notify_all()
+
+    def _wait(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        self._condition.wait(remaining)
+        return True
+
+    def _can_run(self, ticket):
+        priority, _, model = ticket
+        if self._active.get(model, 0) >= self.get_model_limit(model):
+            return False
+        limit = self.max_concurrency
+        if priority == BACKGROUND:
+            limit -= self.reserved_interactive
+        if self._total_active >= limit:
+            return False
+        for other in self._waiting:
+            if other >= ticket:
+                continue
+            # Requests for the same model run in order, and background
+            # requests wait while any interactive request is queued
+            if other[2] == model or other[0] < priority:
+                return False
+        return True
+
+    def get_stats(self):
+        with self._condition:
+            return {
+                "active": dict(self._active),
+                "total_active": self._total_active,
+                "queued": {PRIORITY_NAMES[priority]: count
+                           for priority, count in self._queued.items()},
+                **{PRIORITY_NAMES[priority]: dict(stats)
+                   for priority, stats in self._stats.items()},
+            }
+
+
+class NullRequestScheduler:
+    """Stand-in used when the scheduler is disabled in the config."""
+
+    @contextmanager
+    def slot(self, model, priority=INTERACTIVE):
+        yield
+
+    def acquire(self, model, priority=INTERACTIVE):
+        pass
+
+    def release(self, model):
+        pass
+
+    def get_stats(self):
+        return {}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_request_scheduler():
+    """Return the process-wide request scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            if config.get("scheduler", {}).get("enabled", True):
+                _scheduler = RequestScheduler()
+            else:
+                _scheduler = NullRequestScheduler()
+        return _scheduler
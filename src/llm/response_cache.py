@@ -0,0 +1,247 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from src.utils import config_loader
+from src.utils.metrics import record_span
+
+config = config_loader.get_config()
+
+
+def normalize_question(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def normalize_vector(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticResponseCache:
+    """
+    SQLite-backed cache of PDF-chat answers, looked up by question
+    similarity.
+
+    Answers are keyed by model, collection version and the normalized
+    question embedding; a question whose embedding has a cosine similarity
+    of at least ``similarity_threshold`` with a cached one is answered from
+    the cache. ``bump_collection_version`` is called whenever the documents
+    change and drops every answer given from the old documents. The least
+    recently used answers are evicted beyond ``max_entries``.
+    """
+
+    def __init__(self, path, similarity_threshold=0.95, max_entries=1000):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS responses (
+            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model TEXT NOT NULL,
+            collection_version INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            answer TEXT NOT NULL,
+            duration_s REAL NOT NULL,
+            last_used REAL NOT NULL
+        )
+        """)
+        self.conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_responses_model_version
+        ON responses (model, collection_version, entry_id)
+        """)
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS cache_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        """)
+        self.conn.commit()
+        self._lock = threading.Lock()
+        # (model, collection version) -> entry ids and their vectors as
+        # the rows of a matrix. New rows, also those written by other
+        # processes, are read incrementally on lookup
+        self._index = {}
+        self.stats = {"hits": 0, "misses": 0, "latency_saved_s": 0.0}
+
+    def get_collection_version(self):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM cache_meta "
+                "WHERE key = 'collection_version'").fetchone()
+        return row[0] if row else 0
+
+    def bump_collection_version(self):
+        """
+        Invalidate every cached answer, e.g. after documents were added.
+        """
+        with self._lock, self.conn:
+            self.conn.execute("""
+            INSERT INTO cache_meta (key, value)
+            VALUES ('collection_version', 1)
+            ON CONFLICT (key) DO UPDATE SET value = value + 1
+            """)
+            (version,) = self.conn.execute(
+                "SELECT value FROM cache_meta "
+                "WHERE key = 'collection_version'").fetchone()
+            self.conn.execute(
+                "DELETE FROM responses WHERE collection_version < ?",
+                (version,))
+            self._index.clear()
+        print(f"Response cache invalidated, collection version {version}.")
+
+    def lookup(self, model, collection_version, vector):
+        """
+        Return the cached answer to the most similar question, or None if
+        no cached question is similar enough.
+        """
+        start_time = time.perf_counter()
+        query = normalize_vector(vector)
+        answer = None
+        with self._lock:
+            entry_ids, matrix = self._load_index(model, collection_version)
+            # Vectors of another embedding model never match
+            if entry_ids and matrix.shape[1] == query.shape[0]:
+                similarities = matrix @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    answer = self._get_answer(entry_ids[best])
+
+            lookup_s = time.perf_counter() - start_time
+            if answer is None:
+                self.stats["misses"] += 1
+            else:
+                answer, duration_s = answer
+                self.stats["hits"] += 1
+                self.stats["latency_saved_s"] += max(0.0,
+                                                     duration_s - lookup_s)
+        record_span("response_cache.lookup", lookup_s, model=model,
+                    hit=answer is not None)
+        return answer
+
+    def put(self, model, collection_version, vector, question, answer,
+            duration_s):
+        """
+        Cache ``answer`` unless the documents changed since the lookup.
+        """
+        vector = normalize_vector(vector)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM cache_meta "
+                "WHERE key = 'collection_version'").fetchone()
+            if (row[0] if row else 0) != collection_version:
+                return
+            with self.conn:
+                self.conn.execute("""
+                INSERT INTO responses (model, collection_version, question,
+                vector, answer, duration_s, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (model, collection_version, question, vector.tobytes(),
+                      answer, duration_s, time.time()))
+                self._trim()
+
+    def _load_index(self, model, collection_version):
+        key = (model, collection_version)
+        for stale_key in [other for other in self._index
+                          if other[1] != collection_version]:
+            # Bumped by another process
+            del self._index[stale_key]
+        entry_ids, matrix = self._index.get(key, ([], None))
+        rows = self.conn.execute("""
+        SELECT entry_id, vector FROM responses
+        WHERE model = ? AND collection_version = ? AND entry_id > ?
+        ORDER BY entry_id
+        """, (model, collection_version,
+              entry_ids[-1] if entry_ids else 0)).fetchall()
+        if rows:
+            vectors = np.stack([np.frombuffer(vector, dtype=np.float32)
+                                for _, vector in rows])
+            matrix = (vectors if matrix is None
+                      else np.concatenate([matrix, vectors]))
+            entry_ids = entry_ids + [entry_id for entry_id, _ in rows]
+            self._index[key] = (entry_ids, matrix)
+        return entry_ids, matrix
+
+    def _get_answer(self, entry_id):
+        row = self.conn.execute(
+            "SELECT answer, duration_s FROM responses WHERE entry_id = ?",
+            (entry_id,)).fetchone()
+        if row is None:
+            # Evicted since the index was loaded
+            self._index.clear()
+            return None
+        with self.conn:
+            self.conn.execute(
+                "UPDATE responses SET last_used = ? WHERE entry_id = ?",
+                (time.time(), entry_id))
+        return row
+
+    def _trim(self):
+        (count,) = self.conn.execute(
+            "SELECT COUNT(*) FROM responses").fetchone()
+        if count <= self.max_entries:
+            return
+        self.conn.execute("""
+        DELETE FROM responses WHERE entry_id IN (
+            SELECT entry_id FROM responses ORDER BY last_used ASC LIMIT ?
+        )
+        """, (count - self.max_entries,))
+        self._index.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            (stats["entries"],) = self.conn.execute(
+                "SELECT COUNT(*) FROM responses").fetchone()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["collection_version"] = self.get_collection_version()
+        return stats
+
+
+class NullResponseCache:
+    """Stand-in used when the response cache is disabled in the config."""
+
+    def get_collection_version(self):
+        return 0
+
+    def bump_collection_version(self):
+        pass
+
+    def lookup(self, model, collection_version, vector):
+        return None
+
+    def put(self, model, collection_version, vector, question, answer,
+            duration_s):
+        pass
+
+    def get_stats(self):
+        return {}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide PDF-chat response cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            cache_config = config.get("response_cache", {})
+            if cache_config.get("enabled", True):
+                _cache = SemanticResponseCache(
+                    cache_config.get("path",
+                                     "./chat_sessions/response_cache.db"),
+                    cache_config.get("similarity_threshold", 0.95),
+                    cache_config.get("max_entries", 1000))
+            else:
+                _cache = NullResponseCache()
+        return _cache
@@ -0,0 +1,79 @@
+import streamlit as st
+
+from src.handler.image_handler import get_image_payload_cache
+from src.llm.model_residency import get_residency_manager
+from src.llm.request_scheduler import get_request_scheduler
+from src.llm.response_cache import get_response_cache
+from src.utils.metrics import get_metrics_store
+
+TIME_WINDOWS = {
+    "Last hour": 3600,
+    "Last 24 hours": 24 * 3600,
+    "Last 7 days": 7 * 24 * 3600,
+}
+
+
+def main():
+    st.title("Diagnostics")
+    metrics_store = get_metrics_store()
+
+    window = st.selectbox("Time window", list(TIME_WINDOWS), index=1)
+    since_s = TIME_WINDOWS[window]
+
+    st.subheader("Latency per operation")
+    summary = metrics_store.summarize(since_s)
+    if not summary:
+        st.info("No metrics recorded yet.")
+    else:
+        st.dataframe(summary, use_container_width=True)
+
+        st.subheader("Tokens per second per model")
+        st.bar_chart({row["model"]: row["tokens_per_s"] for row in summary
+                      if row["name"] == "llm.chat" and row["tokens_per_s"]})
+
+        st.subheader("Duration histogram")
+        names = sorted({row["name"] for row in summary})
+        name = st.selectbox("Operation", names)
+        durations = metrics_store.load_durations(name, since_s)
+        st.bar_chart(histogram(durations))
+
+    st.subheader("Model residency")
+    st.dataframe(get_residency_manager().get_stats(),
+                 use_container_width=True)
+
+    st.subheader("Ollama request scheduler")
+    st.json(get_request_scheduler().get_stats())
+
+    st.subheader("PDF-chat response cache")
+    st.json(get_response_cache().get_stats())
+
+    st.subheader("Image payload cache")
+    st.json(get_image_payload_cache().get_stats())
+
+    # Loads chroma, so only imported when the page is shown
+    from src.database.vectordb_handler import get_ollama_embeddings
+
+    embeddings = get_ollama_embeddings()
+    if hasattr(embeddings, "get_stats"):
+        st.subheader("Embedding cache")
+        st.json(embeddings.get_stats())
+
+    st.download_button("Download Prometheus metrics",
+                       metrics_store.export_prometheus(since_s),
+                       file_name="chatbot_metrics.prom",
+                       mime="text/plain")
+
+
+def histogram(values, bins=20):
+    if not values:
+        return {}
+    low, high = min(values), max(values)
+    width = (high - low) / bins or 1
+    counts = {}
+    for value in values:
+        bucket = low + min(bins - 1, int((value - low) / width)) * width
+        counts[f"{bucket:.3f}s"] = counts.get(f"{bucket:.3f}s", 0) + 1
+    return counts
+
+
+main()
@@ -0,0 +1,292 @@
+"""
+Headless HTTP API for the chat app, next to the Streamlit UI.
+
+The server runs on one asyncio event loop; the blocking chat, database,
+vector store and transcription work of ``src.service.chat_service`` runs
+on a thread pool, so many clients are served concurrently by one process.
+Streamed answers are sent as NDJSON, one ``{"content": ...}`` line per
+chunk and a final ``{"done": true, ...}`` line.
+
+Usage:
+    python -m src.service.api_server --host 127.0.0.1 --port 8600
+
+Endpoints:
+    GET    /api/health
+    GET    /api/models
+    GET    /api/sessions
+    POST   /api/sessions
+    GET    /api/sessions/{session_id}/messages?limit=&before=&media=
+    DELETE /api/sessions/{session_id}
+    POST   /api/chat          JSON: message, model, session_id, pdf_chat,
+                              stream
+    POST   /api/image-chat    multipart: image, message, model, session_id,
+                              stream
+    POST   /api/audio-chat    multipart: audio, model, message, session_id,
+                              stream
+    POST   /api/pdfs          multipart: one or more pdf files, replace
+"""
+import argparse
+import asyncio
+import functools
+import io
+import json
+
+from aiohttp import web
+from concurrent.futures import ThreadPoolExecutor
+from src.database.db_operations import init_db, use_thread_read_connection
+from src.handler.asr_registry import warmup_asr_model
+from src.service import chat_service
+from src.utils import config_loader
+from src.utils.utils import convert_bytes_to_base64
+
+config = config_loader.get_config()
+
+STREAM_END = object()
+
+
+class UploadedFile(io.BytesIO):
+    """A multipart upload, shaped like Streamlit's UploadedFile."""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+def error_response(message, status=400):
+    return web.json_response({"error": message}, status=status)
+
+
+def parse_bool(value, default=False):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+async def run_blocking(request, func, *args, **kwargs):
+    """Run ``func`` on the server's thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(
+        request.app["executor"], functools.partial(func, *args, **kwargs))
+
+
+async def read_multipart(request):
+    """
+    Read a multipart body.
+
+    Returns:
+        tuple: The form fields as a dict and the files as a list of
+        (field name, ``UploadedFile``).
+    """
+    fields = {}
+    files = []
+    reader = await request.multipart()
+    async for part in reader:
+        if part.filename:
+            files.append((part.name,
+                          UploadedFile(await part.read(), part.filename)))
+        else:
+            fields[part.name] = await part.text()
+    return fields, files
+
+
+async def send_answer(request, answer, stream, **extra):
+    """
+    Send an answer from the chat service, streaming it as NDJSON if it is
+    a generator of chunks.
+    """
+    if not stream:
+        return web.json_response({"answer": answer, **extra})
+
+    response = web.StreamResponse(
+        headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    try:
+        while True:
+            # Each chunk is pulled from Ollama on a worker thread
+            chunk = await run_blocking(request, next, answer, STREAM_END)
+            if chunk is STREAM_END:
+                break
+            await response.write(
+                json.dumps({"content": chunk}).encode("utf-8") + b"\n")
+        await response.write(
+            json.dumps({"done": True, **extra}).encode("utf-8") + b"\n")
+        await response.write_eof()
+    finally:
+        # Closes the Ollama stream if the client went away
+        try:
+            await run_blocking(request, answer.close)
+        except ValueError:
+            pass
+    return response
+
+
+async def health(request):
+    return web.json_response({"status": "ok"})
+
+
+async def list_models(request):
+    endpoint = request.query.get("endpoint", "ollama")
+    try:
+        models = await run_blocking(request, chat_service.list_models,
+                                    endpoint)
+    except ValueError as e:
+        return error_response(str(e))
+    return web.json_response({"models": models})
+
+
+async def list_sessions(request):
+    sessions = await run_blocking(request, chat_service.list_sessions)
+    return web.json_response({"sessions": sessions})
+
+
+async def create_session(request):
+    return web.json_response(
+        {"session_id": chat_service.new_session_id()}, status=201)
+
+
+async def get_messages(request):
+    try:
+        limit = request.query.get("limit")
+        limit = int(limit) if limit else None
+        before = request.query.get("before")
+        before = int(before) if before else None
+    except ValueError:
+        return error_response("limit and before must be integers")
+    include_media = parse_bool(request.query.get("media"))
+
+    def load():
+        messages = chat_service.get_messages(
+            request.match_info["session_id"], limit, before)
+        for message in messages:
+            if message["message_type"] != "text":
+                # Media is only read from the blob store when asked for
+                message["content"] = (
+                    convert_bytes_to_base64(message["content"].read())
+                    if include_media else None)
+        return messages
+
+    messages = await run_blocking(request, load)
+    return web.json_response({"messages": messages})
+
+
+async def delete_session(request):
+    await run_blocking(request, chat_service.delete_session,
+                       request.match_info["session_id"])
+    return web.Response(status=204)
+
+
+async def chat(request):
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        return error_response("Body must be JSON")
+    if not isinstance(body, dict):
+        return error_response("Body must be a JSON object")
+    if not body.get("message") or not body.get("model"):
+        return error_response("message and model are required")
+
+    session_id = body.get("session_id") or chat_service.new_session_id()
+    stream = parse_bool(body.get("stream"), default=True)
+    try:
+        answer = await run_blocking(
+            request, chat_service.chat, session_id, body["message"],
+            body["model"], endpoint=body.get("endpoint", "ollama"),
+            pdf_chat=parse_bool(body.get("pdf_chat")), stream=stream)
+    except ValueError as e:
+        return error_response(str(e))
+    return await send_answer(request, answer, stream, session_id=session_id)
+
+
+async def image_chat(request):
+    fields, files = await read_multipart(request)
+    images = [upload for name, upload in files if name == "image"]
+    if not images or not fields.get("message") or not fields.get("model"):
+        return error_response("image, message and model are required")
+
+    session_id = fields.get("session_id") or chat_service.new_session_id()
+    stream = parse_bool(fields.get("stream"), default=True)
+    try:
+        answer = await run_blocking(
+            request, chat_service.image_chat, session_id, fields["message"],
+            images[0].getvalue(), fields["model"],
+            endpoint=fields.get("endpoint", "ollama"), stream=stream)
+    except ValueError as e:
+        return error_response(str(e))
+    return await send_answer(request, answer, stream, session_id=session_id)
+
+
+async def audio_chat(request):
+    fields, files = await read_multipart(request)
+    audios = [upload for name, upload in files if name == "audio"]
+    if not audios or not fields.get("model"):
+        return error_response("audio and model are required")
+
+    session_id = fields.get("session_id") or chat_service.new_session_id()
+    stream = parse_bool(fields.get("stream"), default=True)
+    try:
+        transcript, answer = await run_blocking(
+            request, chat_service.audio_chat, session_id,
+            audios[0].getvalue(), fields["model"],
+            user_input=fields.get("message"),
+            endpoint=fields.get("endpoint", "ollama"), stream=stream)
+    except ValueError as e:
+        return error_response(str(e))
+    return await send_answer(request, answer, stream, session_id=session_id,
+                             transcript=transcript)
+
+
+async def upload_pdfs(request):
+    fields, files = await read_multipart(request)
+    pdfs = [upload for _, upload in files]
+    if not pdfs:
+        return error_response("No pdf files uploaded")
+    await run_blocking(request, chat_service.ingest_pdfs, pdfs,
+                       replace=parse_bool(fields.get("replace")))
+    return web.json_response({"files": [pdf.name for pdf in pdfs]})
+
+
+async def shutdown_executor(app):
+    app["executor"].shutdown(wait=False)
+
+
+def create_app():
+    server_config = config.get("api_server", {})
+    app = web.Application(
+        client_max_size=server_config.get("max_upload_mb", 200) * 1024 ** 2)
+    app["executor"] = ThreadPoolExecutor(
+        max_workers=server_config.get("worker_threads", 32),
+        thread_name_prefix="api-worker",
+        initializer=use_thread_read_connection)
+    app.on_cleanup.append(shutdown_executor)
+    app.add_routes([
+        web.get("/api/health", health),
+        web.get("/api/models", list_models),
+        web.get("/api/sessions", list_sessions),
+        web.post("/api/sessions", create_session),
+        web.get("/api/sessions/{session_id}/messages", get_messages),
+        web.delete("/api/sessions/{session_id}", delete_session),
+        web.post("/api/chat", chat),
+        web.post("/api/image-chat", image_chat),
+        web.post("/api/audio-chat", audio_chat),
+        web.post("/api/pdfs", upload_pdfs),
+    ])
+    return app
+
+
+def main():
+    server_config = config.get("api_server", {})
+    parser = argparse.ArgumentParser(description="Run the chat API server.")
+    parser.add_argument("--host",
+                        default=server_config.get("host", "127.0.0.1"))
+    parser.add_argument("--port", type=int,
+                        default=server_config.get("port", 8600))
+    args = parser.parse_args()
+
+    init_db()
+    warmup_asr_model()
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
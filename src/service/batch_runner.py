@@ -0,0 +1,243 @@
+"""
+Run a JSONL file of prompts through the chat pipeline.
+
+Every input line is a JSON object with a ``prompt`` and optionally an
+``id`` (unique within the file), ``session_id``, ``model``, ``endpoint``,
+``pdf_chat`` flag and ``image_path``. Prompts with a ``session_id`` are
+answered with that session's history and saved to it, in file order per
+session; the others are answered on their own. One JSON line per
+prompt, with the answer and its timing, is appended to the output as soon
+as it is done.
+
+The input is streamed with a bounded number of prompts in flight, so the
+memory use does not grow with the file. Prompts already answered in the
+output are skipped, so an interrupted run continues where it stopped.
+
+Usage:
+    python -m src.service.batch_runner prompts.jsonl --output answers.jsonl
+        --model gemma:2b --workers 4
+"""
+import argparse
+import json
+import os
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from src.database.db_operations import init_db
+from src.llm.chat_api_handler import ChatAPIHandler
+from src.service import chat_service
+from src.utils.metrics import percentile
+
+
+def iter_prompts(path):
+    """
+    Yield ``(id, prompt, error)`` for every line of the input file. The id
+    is the line's ``id`` or, without one, ``line-<line number>``. Lines
+    that are not a JSON object with a prompt, or that repeat an id, are
+    yielded with no prompt and the reason as error.
+    """
+    first_line_of_id = {}
+    with open(path, encoding="utf-8") as input_file:
+        for line_number, line in enumerate(input_file, start=1):
+            if not line.strip():
+                continue
+            line_id = f"line-{line_number}"
+            try:
+                prompt = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_id, None, f"Line {line_number}: Invalid JSON: {e}"
+                continue
+            if not isinstance(prompt, dict):
+                yield (line_id, None,
+                       f"Line {line_number}: Not a JSON object")
+                continue
+
+            prompt_id = str(prompt["id"]) if "id" in prompt else line_id
+            if prompt_id in first_line_of_id:
+                yield (prompt_id, None,
+                       f"Line {line_number}: Duplicate id {prompt_id!r}, "
+                       f"already used on line {first_line_of_id[prompt_id]}")
+                continue
+            first_line_of_id[prompt_id] = line_number
+            if not isinstance(prompt.get("prompt"), str) or \
+                    not prompt["prompt"]:
+                yield (prompt_id, None,
+                       f"Line {line_number}: missing 'prompt'")
+                continue
+            yield prompt_id, prompt, None
+
+
+def load_completed_ids(path):
+    """
+    Return the ids answered without error in an earlier run.
+    """
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as output_file:
+        for line in output_file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Cut off by the interruption
+            if not result.get("error"):
+                completed.add(result["id"])
+    return completed
+
+
+def ends_with_newline(path):
+    with open(path, "rb") as output_file:
+        output_file.seek(-1, os.SEEK_END)
+        return output_file.read(1) == b"\n"
+
+
+def answer_prompt(prompt_id, prompt, default_model, previous=None):
+    """
+    Answer one prompt, streaming it to measure the time to first token.
+    Prompts of a session are saved to it once answered without error, so
+    retrying a failed prompt does not save it twice.
+
+    Returns:
+        dict: The output line.
+    """
+    if previous is not None:
+        # The previous prompt of the same session has to be in its history
+        wait([previous])
+
+    model = prompt.get("model", default_model)
+    endpoint = prompt.get("endpoint", "ollama")
+    session_id = prompt.get("session_id")
+    result = {"id": prompt_id, "session_id": session_id, "model": model}
+    if not model:
+        result["error"] = "No model given, use --model or a model field"
+        return result
+
+    start_time = time.perf_counter()
+    try:
+        image = None
+        if prompt.get("image_path"):
+            with open(prompt["image_path"], "rb") as image_file:
+                image = image_file.read()
+
+        chat_history = []
+        if session_id and not image:
+            chat_history = chat_service.get_chat_history(session_id)
+        chunks = ChatAPIHandler.chat(
+            user_input=prompt["prompt"], chat_history=chat_history,
+            model=model, endpoint=endpoint,
+            pdf_chat=prompt.get("pdf_chat", False) and not image,
+            image=image, stream=True)
+
+        parts = []
+        for chunk in chunks:
+            if not parts:
+                result["time_to_first_token_s"] = (time.perf_counter() -
+                                                   start_time)
+            parts.append(chunk)
+        result["answer"] = "".join(parts)
+        if result["answer"].startswith("OLLAMA ERROR: "):
+            result["error"] = result["answer"]
+        elif session_id:
+            chat_service.save_turn(session_id, prompt["prompt"],
+                                   result["answer"], model, image)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["duration_s"] = time.perf_counter() - start_time
+    return result
+
+
+def run_batch(input_path, output_path, default_model, workers=4,
+              resume=True):
+    """
+    Answer the prompts of ``input_path`` with ``workers`` threads and
+    append the results to ``output_path``.
+
+    Returns:
+        dict: The number of answered, failed and skipped prompts and the
+        latency percentiles of this run.
+    """
+    completed = load_completed_ids(output_path) if resume else set()
+    durations = []
+    stats = {"answered": 0, "failed": 0, "skipped": 0}
+    in_flight = set()
+    last_of_session = {}
+    with open(output_path, "a" if resume else "w",
+              encoding="utf-8") as output_file, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        if output_file.tell() and not ends_with_newline(output_path):
+            output_file.write("\n")
+
+        def write_result(result):
+            output_file.write(json.dumps(result) + "\n")
+            output_file.flush()
+            if result.get("error"):
+                stats["failed"] += 1
+            else:
+                stats["answered"] += 1
+                durations.append(result["duration_s"])
+
+        def write_finished(done):
+            for future in done:
+                in_flight.discard(future)
+                result = future.result()
+                write_result(result)
+                session_id = result["session_id"]
+                if last_of_session.get(session_id) is future:
+                    del last_of_session[session_id]
+
+        for prompt_id, prompt, error in iter_prompts(input_path):
+            if prompt_id in completed:
+                stats["skipped"] += 1
+                continue
+            if len(in_flight) >= workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                write_finished(done)
+            if error:
+                write_result({"id": prompt_id, "session_id": None,
+                              "error": error})
+                continue
+
+            session_id = prompt.get("session_id")
+            future = executor.submit(
+                answer_prompt, prompt_id, prompt, default_model,
+                last_of_session.get(session_id) if session_id else None)
+            if session_id:
+                last_of_session[session_id] = future
+            in_flight.add(future)
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            write_finished(done)
+
+    durations.sort()
+    stats["p50_s"] = percentile(durations, 0.5)
+    stats["p95_s"] = percentile(durations, 0.95)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a JSONL file of prompts through the chat pipeline.")
+    parser.add_argument("input", help="JSONL file of prompts")
+    parser.add_argument("--output", required=True,
+                        help="JSONL file the answers are appended to")
+    parser.add_argument("--model",
+                        help="Model for prompts that do not name one")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Overwrite the output instead of skipping "
+                             "the prompts answered in it")
+    args = parser.parse_args()
+
+    init_db()
+    start_time = time.perf_counter()
+    stats = run_batch(args.input, args.output, args.model,
+                      workers=args.workers, resume=not args.no_resume)
+    print(f"Answered {stats['answered']}, failed {stats['failed']}, "
+          f"skipped {stats['skipped']} prompts in "
+          f"{time.perf_counter() - start_time:.1f} seconds "
+          f"(p50 {stats['p50_s']:.2f}s, p95 {stats['p95_s']:.2f}s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Chat, PDF, image and audio flows independent of the Streamlit UI.
+
+Every function takes the session, endpoint and model explicitly instead of
+reading ``st.session_state``, so the same flows serve the Streamlit app and
+the HTTP API server.
+"""
+import threading
+import uuid
+
+from src.database.db_operations import (
+    get_all_chat_history_ids, delete_chat_history, load_messages_page,
+    save_text_message, save_image_message, save_audio_message)
+from src.handler.image_handler import get_history_image
+from src.llm.chat_api_handler import ChatAPIHandler
+from src.llm.conversation_summary import load_chat_memory, schedule_summary
+from src.utils import config_loader
+from src.utils.utils import list_ollama_models
+
+config = config_loader.get_config()
+
+# Chroma writes of concurrent uploads would interleave their dedup checks
+_ingestion_lock = threading.Lock()
+
+
+def new_session_id():
+    # Timestamps have one second resolution, clients creating sessions in
+    # the same second would share one
+    return uuid.uuid4().hex
+
+
+def list_sessions():
+    return get_all_chat_history_ids()
+
+
+def list_models(endpoint="ollama"):
+    if endpoint == "ollama":
+        return list_ollama_models()
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+def get_messages(session_id, limit=None, before_message_id=None):
+    return load_messages_page(session_id, limit,
+                              before_message_id=before_message_id)
+
+
+def delete_session(session_id):
+    delete_chat_history(session_id)
+
+
+def get_chat_history(session_id):
+    return load_chat_memory(session_id,
+                            config["chat_config"]["chat_memory_length"])
+
+
+def chat(session_id, user_input, model, endpoint="ollama", pdf_chat=False,
+         stream=False):
+    """
+    Answer ``user_input`` in the context of the session's history and save
+    both messages to the session.
+
+    Returns:
+        The answer, or a generator of answer chunks if ``stream`` is set.
+        The answer of a stream is saved once it has been consumed.
+    """
+    answer = ChatAPIHandler.chat(
+        user_input=user_input, chat_history=get_chat_history(session_id),
+        model=model, endpoint=endpoint, pdf_chat=pdf_chat, stream=stream)
+    save_text_message(session_id, "user", user_input)
+    return save_answer(session_id, answer, model, stream)
+
+
+def image_chat(session_id, user_input, image_bytes, model,
+               endpoint="ollama", stream=False):
+    answer = ChatAPIHandler.chat(
+        user_input=user_input, chat_history=[], model=model,
+        endpoint=endpoint, image=image_bytes, stream=stream)
+    save_text_message(session_id, "user", user_input)
+    save_image_message(session_id, "user", get_history_image(image_bytes))
+    return save_answer(session_id, answer, model, stream)
+
+
+def audio_chat(session_id, audio_bytes, model, user_input=None,
+               endpoint="ollama", stream=False):
+    """
+    Transcribe ``audio_bytes``, split at pauses into segments that are
+    transcribed in batches, and answer it. With ``user_input`` the
+    transcript is appended to it and answered without history, like an
+    uploaded audio file in the app; otherwise it is answered as the next
+    message of the session, like a voice recording.
+    """
+    from src.handler.audio_handler import transcribe_long_audio
+
+    transcript = " ".join(segment["text"].strip()
+                          for segment in transcribe_long_audio(audio_bytes))
+    if user_input:
+        answer = ChatAPIHandler.chat(
+            user_input=user_input + "\n" + transcript, chat_history=[],
+            model=model, endpoint=endpoint, stream=stream)
+        save_text_message(session_id, "user", user_input)
+    else:
+        answer = ChatAPIHandler.chat(
+            user_input=transcript, chat_history=get_chat_history(session_id),
+            model=model, endpoint=endpoint, stream=stream)
+    save_audio_message(session_id, "user", audio_bytes)
+    return transcript, save_answer(session_id, answer, model, stream)
+
+
+def save_answer(session_id, answer, model, stream):
+    if not stream:
+        save_text_message(session_id, "assistant", answer)
+        schedule_summary(session_id, model)
+        return answer
+    return save_when_consumed(session_id, answer, model)
+
+
+def save_when_consumed(session_id, chunks, model):
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    save_text_message(session_id, "assistant", "".join(parts))
+    schedule_summary(session_id, model)
+
+
+def save_turn(session_id, user_input, answer, model, image_bytes=None):
+    """
+    Save a user message, with its image if any, together with its answer,
+    for callers that only save a turn once it was answered.
+    """
+    save_text_message(session_id, "user", user_input)
+    if image_bytes is not None:
+        save_image_message(session_id, "user",
+                           get_history_image(image_bytes))
+    save_text_message(session_id, "assistant", answer)
+    schedule_summary(session_id, model)
+
+
+def ingest_pdfs(pdf_files, progress_callback=None, replace=False):
+    """
+    Add ``pdf_files`` (file-like objects with a ``name``) to the vector
+    store, one upload at a time. With ``replace`` stored files of the same
+    names are deleted.
+    """
+    from src.handler.pdf_handler import add_documents_to_db
+
+    with _ingestion_lock:
+        add_documents_to_db(pdf_files, progress_callback=progress_callback,
+                            replace=replace)
@@ -1,5 +1,13 @@
+import threading
 import yaml
 
+from pathlib import Path
+
+CONFIG_PATH = Path(__file__).parent.parent / "config" / "config.yaml"
+
+_config = None
+_config_lock = threading.Lock()
+
 
 def load_config(file_path: str) -> dict:
     """
@@ -13,4 +21,19 @@ def load_config(file_path: str) -> dict:
     """
     with open(file_path, 'r') as file:
         config = yaml.safe_load(file)
-    return config
\ No newline at end of file
+    return config
+
+
+def get_config() -> dict:
+    """
+    Return the application configuration. The config file is read once per
+    process and every module shares the same dictionary.
+
+    Returns:
+        dict: The loaded configuration as a dictionary.
+    """
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = load_config(CONFIG_PATH)
+        return _config
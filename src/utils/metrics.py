@@ -0,0 +1,295 @@
+"""
+Latency and throughput metrics for chat, retrieval, embedding, ingestion,
+ASR and database operations.
+
+Usage:
+    python -m src.utils.metrics    # print the Prometheus text export
+"""
+import atexit
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+from src.utils import config_loader
+
+config = config_loader.get_config()
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(sorted_values, quantile):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1,
+                max(0, round(quantile * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class MetricsStore:
+    """
+    Local SQLite store of timed spans.
+
+    Spans are buffered in memory and written in batches by a background
+    thread, every ``flush_interval_s`` seconds or as soon as
+    ``flush_every`` spans are buffered, so recording one costs no disk I/O
+    on the request path. Spans older than ``retention_days`` are dropped
+    once every ``retention_interval_s`` seconds.
+    """
+
+    def __init__(self, path, retention_days=7, flush_every=50,
+                 flush_interval_s=5, retention_interval_s=3600):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.retention_s = retention_days * 24 * 3600
+        self.flush_every = flush_every
+        self.flush_interval_s = flush_interval_s
+        self.retention_interval_s = retention_interval_s
+        # Guards the buffer only, the connection has its own lock so
+        # recording never waits for a write
+        self._condition = threading.Condition()
+        self._buffer = []
+        self._writer = None
+        self._db_lock = threading.Lock()
+        self._last_retention = None
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS spans (
+            span_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            model TEXT,
+            started_at REAL NOT NULL,
+            duration_s REAL NOT NULL,
+            prompt_tokens INTEGER,
+            eval_tokens INTEGER,
+            eval_duration_s REAL,
+            attributes TEXT
+        )
+        """)
+        self.conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_spans_name_started
+        ON spans (name, started_at)
+        """)
+        self.conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_spans_started
+        ON spans (started_at)
+        """)
+        self.conn.commit()
+
+    def record(self, name, duration_s, model=None, prompt_tokens=None,
+               eval_tokens=None, eval_duration_s=None, **attributes):
+        """
+        Record one span.
+
+        Args:
+            name (str): The operation, e.g. ``llm.chat``.
+            duration_s (float): How long it took.
+            model (str, optional): The model involved.
+            prompt_tokens (int, optional): Prompt tokens evaluated.
+            eval_tokens (int, optional): Tokens generated.
+            eval_duration_s (float, optional): Generation time, used for
+                tokens/sec.
+            **attributes: Per-stage durations and other details.
+        """
+        with self._condition:
+            self._buffer.append((
+                name, model, time.time() - duration_s, duration_s,
+                prompt_tokens, eval_tokens, eval_duration_s,
+                json.dumps(attributes, default=str) if attributes else None))
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._run, name="metrics-writer", daemon=True)
+                self._writer.start()
+            if len(self._buffer) >= self.flush_every:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: len(self._buffer) >= self.flush_every,
+                    timeout=self.flush_interval_s)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Writing metrics failed: {e}")
+
+    def flush(self):
+        """Write the buffered spans and apply the retention if due."""
+        with self._condition:
+            spans, self._buffer = self._buffer, []
+        with self._db_lock:
+            if spans:
+                with self.conn:
+                    self.conn.executemany("""
+                    INSERT INTO spans (name, model, started_at, duration_s,
+                    prompt_tokens, eval_tokens, eval_duration_s, attributes)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """, spans)
+            if (self._last_retention is None or
+                    time.monotonic() - self._last_retention >=
+                    self.retention_interval_s):
+                self._last_retention = time.monotonic()
+                with self.conn:
+                    self.conn.execute(
+                        "DELETE FROM spans WHERE started_at < ?",
+                        (time.time() - self.retention_s,))
+
+    def summarize(self, since_s=None):
+        """
+        Summarize the spans of the last ``since_s`` seconds (or all).
+
+        Returns:
+            list: One dict per (name, model) with count, mean, p50, p95,
+            p99 and, where tokens were recorded, tokens/sec.
+        """
+        self.flush()
+        with self._db_lock:
+            rows = self.conn.execute("""
+            SELECT name, model, duration_s, eval_tokens, eval_duration_s
+            FROM spans WHERE started_at >= ?
+            """, (time.time() - since_s if since_s else 0,)).fetchall()
+
+        groups = {}
+        for name, model, duration_s, eval_tokens, eval_duration_s in rows:
+            group = groups.setdefault(
+                (name, model or ""),
+                {"durations": [], "eval_tokens": 0, "eval_duration_s": 0.0})
+            group["durations"].append(duration_s)
+            if eval_tokens and eval_duration_s:
+                group["eval_tokens"] += eval_tokens
+                group["eval_duration_s"] += eval_duration_s
+
+        summary = []
+        for (name, model), group in sorted(groups.items()):
+            durations = sorted(group["durations"])
+            row = {"name": name, "model": model, "count": len(durations),
+                   "mean_s": sum(durations) / len(durations)}
+            for quantile in QUANTILES:
+                row[f"p{int(quantile * 100)}_s"] = percentile(durations,
+                                                              quantile)
+            row["tokens_per_s"] = (
+                group["eval_tokens"] / group["eval_duration_s"]
+                if group["eval_duration_s"] else None)
+            summary.append(row)
+        return summary
+
+    def load_durations(self, name, since_s=None):
+        self.flush()
+        with self._db_lock:
+            rows = self.conn.execute("""
+            SELECT duration_s FROM spans WHERE name = ? AND started_at >= ?
+            """, (name, time.time() - since_s if since_s else 0)).fetchall()
+        return [duration_s for (duration_s,) in rows]
+
+    def export_prometheus(self, since_s=None):
+        """
+        Render the summary in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP chatbot_span_duration_seconds Duration of instrumented "
+            "operations.",
+            "# TYPE chatbot_span_duration_seconds summary",
+        ]
+        tokens_per_s = {}
+        for row in self.summarize(since_s):
+            labels = (f'name="{escape_label(row["name"])}",'
+                      f'model="{escape_label(row["model"])}"')
+            for quantile in QUANTILES:
+                value = row[f"p{int(quantile * 100)}_s"]
+                lines.append(f'chatbot_span_duration_seconds{{{labels},'
+                             f'quantile="{quantile}"}} {value:.6f}')
+            lines.append(f"chatbot_span_duration_seconds_sum{{{labels}}} "
+                         f"{row['mean_s'] * row['count']:.6f}")
+            lines.append(f"chatbot_span_duration_seconds_count{{{labels}}} "
+                         f"{row['count']}")
+            if row["tokens_per_s"] is not None and row["model"]:
+                tokens_per_s[row["model"]] = row["tokens_per_s"]
+
+        lines.append("# HELP chatbot_tokens_per_second Generation "
+                     "throughput per model.")
+        lines.append("# TYPE chatbot_tokens_per_second gauge")
+        for model, value in sorted(tokens_per_s.items()):
+            lines.append(f'chatbot_tokens_per_second{{model='
+                         f'"{escape_label(model)}"}} {value:.3f}')
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return (str(value).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"))
+
+
+class NullMetricsStore:
+    """Stand-in used when metrics are disabled in the config."""
+
+    def record(self, *args, **kwargs):
+        pass
+
+    def flush(self):
+        pass
+
+    def summarize(self, since_s=None):
+        return []
+
+    def load_durations(self, name, since_s=None):
+        return []
+
+    def export_prometheus(self, since_s=None):
+        return ""
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_metrics_store():
+    """Return the process-wide metrics store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            metrics_config = config.get("metrics", {})
+            if metrics_config.get("enabled", True):
+                _store = MetricsStore(
+                    metrics_config.get("path",
+                                       "./chat_sessions/metrics.db"),
+                    metrics_config.get("retention_days", 7))
+                atexit.register(_store.flush)
+            else:
+                _store = NullMetricsStore()
+        return _store
+
+
+def record_span(name, duration_s, **fields):
+    get_metrics_store().record(name, duration_s, **fields)
+
+
+@contextmanager
+def span(name, **fields):
+    """
+    Time the enclosed block and record it as a span. The yielded dict can
+    be updated inside the block to add fields, e.g. token counts.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        record_span(name, time.perf_counter() - start_time, **fields)
+
+
+def timed(name):
+    """Decorator recording every call of the function as span ``name``."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+if __name__ == "__main__":
+    print(get_metrics_store().export_prometheus(), end="")
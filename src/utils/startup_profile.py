@@ -0,0 +1,151 @@
+"""
+Startup profiling of the app, enabled with ``CHATBOT_PROFILE_STARTUP=1``:
+
+    CHATBOT_PROFILE_STARTUP=1 streamlit run src/app.py
+
+Times the import of every module imported after ``start`` and the
+initialization steps wrapped in ``step``, and prints the slowest of them
+once the first page has been rendered.
+"""
+import os
+import sys
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+ENV_VAR = "CHATBOT_PROFILE_STARTUP"
+
+
+def is_enabled():
+    return os.environ.get(ENV_VAR, "") not in ("", "0")
+
+
+class ImportTimer:
+    """
+    Meta path finder that wraps the loader of every module found by the
+    finders after it, to time the execution of the module. The total time
+    of a module includes the modules it imports, its self time does not.
+    """
+
+    def __init__(self):
+        # Module name -> (total seconds, self seconds)
+        self.timings = {}
+        self._local = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self:
+                continue
+            if not hasattr(finder, "find_spec"):
+                return None  # Leave it to the regular import machinery
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        # Builtin and frozen modules are loaded by classes shared by all
+        # of them, which must not be patched
+        if (loader is not None and not isinstance(loader, type) and
+                hasattr(loader, "exec_module")):
+            try:
+                loader.exec_module = self._timed(fullname,
+                                                 loader.exec_module)
+            except AttributeError:
+                pass
+        return spec
+
+    def _timed(self, fullname, exec_module):
+        def timed_exec_module(module):
+            if not hasattr(self._local, "stack"):
+                self._local.stack = []
+            stack = self._local.stack
+            stack.append(0.0)
+            start_time = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                total_s = time.perf_counter() - start_time
+                nested_s = stack.pop()
+                if stack:
+                    stack[-1] += total_s
+                self.timings[fullname] = (total_s, total_s - nested_s)
+        return timed_exec_module
+
+
+class StartupProfile:
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.import_timer = ImportTimer()
+        self.steps = []
+
+    def report(self, top=15):
+        timings = dict(self.import_timer.timings)
+        packages = defaultdict(float)
+        for name, (_, self_s) in timings.items():
+            packages[name.partition(".")[0]] += self_s
+
+        lines = [f"Startup profile, "
+                 f"{time.perf_counter() - self.start_time:.2f}s until the "
+                 f"first page, {sum(packages.values()):.2f}s of it in "
+                 f"{len(timings)} imports:"]
+        lines.append("  Slowest packages (self time of their modules):")
+        for package, self_s in sorted(packages.items(),
+                                      key=lambda item: -item[1])[:top]:
+            lines.append(f"    {self_s:8.3f}s  {package}")
+        lines.append("  App modules (including their imports):")
+        for name, (total_s, _) in sorted(timings.items(),
+                                         key=lambda item: -item[1][0]):
+            if name.startswith("src."):
+                lines.append(f"    {total_s:8.3f}s  {name}")
+        lines.append("  Initialization steps:")
+        for name, duration_s in self.steps:
+            lines.append(f"    {duration_s:8.3f}s  {name}")
+        return "\n".join(lines)
+
+
+_profile = None
+_profile_lock = threading.Lock()
+_reported = False
+
+
+def start():
+    """
+    Start timing imports if profiling is enabled. Only the first call of
+    the process has an effect, so reruns of the app are not profiled.
+    """
+    global _profile
+    with _profile_lock:
+        if not is_enabled() or _profile is not None or _reported:
+            return
+        _profile = StartupProfile()
+        sys.meta_path.insert(0, _profile.import_timer)
+
+
+@contextmanager
+def step(name):
+    """Time an initialization step while the startup is profiled."""
+    profile = _profile
+    if profile is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.steps.append((name, time.perf_counter() - start_time))
+
+
+def report():
+    """Stop profiling and print the report, once per process."""
+    global _profile, _reported
+    with _profile_lock:
+        profile, _profile = _profile, None
+        if profile is None:
+            return
+        _reported = True
+        sys.meta_path.remove(profile.import_timer)
+    print(profile.report())
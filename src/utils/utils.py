@@ -1,17 +1,16 @@
-import aiohttp
 import asyncio
 import base64
-import requests
 import streamlit as st
 import time
 
 from datetime import datetime
-from pathlib import Path
+from src.llm.ollama_client import (get_ollama_client,
+                                   get_async_ollama_client,
+                                   close_async_ollama_client)
 from src.utils import config_loader
+from src.utils.metrics import record_span
 
-PROJECT_ROOT = Path(__file__).parent.parent.parent
-
-config = config_loader.load_config(f"{PROJECT_ROOT}/src/config/config.yaml")
+config = config_loader.get_config()
 
 
 def convert_ns_to_seconds(ns_value):
@@ -31,9 +30,7 @@ def timeit(func):
         start_time = time.time()
         result = func(*args, **kwargs)
         end_time = time.time()
-        execution_time = end_time - start_time
-        print(f"Function '{func.__name__}' executed in \
-              {execution_time:.4f} seconds")
+        record_span(func.__name__, end_time - start_time)
         return result
     return wrapper
 
@@ -44,8 +41,7 @@ def list_ollama_models():
     Returns:
         list: A list of model names.
     """
-    json_response = requests.get(
-        url=config["ollama"]["base_url"] + "/api/tags", timeout=10).json()
+    json_response = get_ollama_client().get("/api/tags").json()
     if json_response.get("error", False):
         return []
     models = [model["name"] for model in json_response["models"]
@@ -81,35 +77,43 @@ def pull_model_in_background(model_name, stream=False):
     else:
         # Otherwise, use asyncio.run() to run it synchronously
         return asyncio.run(
-            pull_ollama_model_async(model_name, stream=stream))
+            pull_and_close_client(model_name, stream=stream))
+
+
+async def pull_and_close_client(model_name, stream=False):
+    # The loop created by asyncio.run() is closed afterwards, so its
+    # client session has to be closed with it
+    try:
+        return await pull_ollama_model_async(model_name, stream=stream)
+    finally:
+        await close_async_ollama_client()
 
 
 async def pull_ollama_model_async(model_name, stream=True, retries=1):
-    url = config["ollama"]["base_url"] + "/api/pull"
     json_data = {"model": model_name, "stream": stream}
+    client = get_async_ollama_client()
 
     for attempt in range(retries):
         try:
-            async with aiohttp.ClientSession(
-                    timeout=aiohttp.ClientTimeout(total=1800)) as session:
-                async with session.post(url, json=json_data) as response:
-                    if stream:
-                        # Handle streaming response
-                        async for chunk in response.content.iter_chunked(1024):
-                            if chunk:
-                                st.info(
-                                    f"Received chunk: {chunk.decode('utf-8')}")
+            async with await client.post("/api/pull",
+                                         json=json_data) as response:
+                if stream:
+                    # Handle streaming response
+                    async for chunk in response.content.iter_chunked(1024):
+                        if chunk:
+                            st.info(
+                                f"Received chunk: {chunk.decode('utf-8')}")
+                else:
+                    json_response = await response.json()
+                    print(json_response)
+
+                    if json_response.get("error", False):
+                        return json_response["error"]
                     else:
-                        json_response = await response.json()
-                        print(json_response)
-
-                        if json_response.get("error", False):
-                            return json_response["error"]
-                        else:
-                            st.session_state.model_options = (
-                                list_ollama_models())
-                            return f"Pull of {model_name} finished."
-                    return "Pulled"
+                        st.session_state.model_options = (
+                            list_ollama_models())
+                        return f"Pull of {model_name} finished."
+                return "Pulled"
         except asyncio.TimeoutError:
             st.warning(f"Timeout on attempt {attempt + 1}. Retrying...")
         except Exception as e: